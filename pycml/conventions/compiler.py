@@ -0,0 +1,257 @@
+# pyCML.conventions.compiler: Builder classes compiled from convention specs
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import collections
+import keyword
+import re
+import warnings
+import xml.etree.ElementTree as ET
+
+from pycml.pycml import AbstractList, CMLError, CMLModule
+
+# Compiled conventions keyed by the id of their spec, see compileConvention
+_compiled = {}
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_]\w*$')
+
+# The prefix of the names used within generated methods, see _compileInit.
+# Attributes whose names start with it are left to CompiledModule.__init__.
+_RESERVED = '__pycml_'
+
+def compileConvention(spec):
+    """Compile a convention spec into a set of module builder classes.
+
+    The spec is a list of nodes in the format described in
+    CMLDoc.getConvention. Each module node, at any depth, is compiled into a
+    subclass of CompiledModule named after its dictRef, eg. JobsList for a
+    dictRef of jobsList. The attributes of the node, fixed values and the
+    names of required (True) and recommended (False) attributes, are checked
+    once here rather than each time a module is built. Each builder is given
+    an __init__ generated for its node, taking its attributes as named
+    arguments and checking each of them in turn, so no dictionaries of
+    arguments or loops over the spec are left when a module is built. The
+    builders produce the same elements as a hand written module class such
+    as those of the simple compchem convention, with much less work per
+    module.
+
+    A node may also give the warning for each recommended attribute that is
+    missing in a 'messages' dictionary. The namespaces of a root node are
+    registered.
+
+    Specs are compiled once and the same classes are returned for later
+    calls with the same spec.
+
+    :param :spec A convention in the format described in CMLDoc.getConvention
+    :type :spec list
+    :return: The builder classes keyed by their names in document order
+    :rtype: collections.OrderedDict
+    """
+
+    try:
+        return _compiled[id(spec)][1]
+    except KeyError:
+        pass
+
+    builders = collections.OrderedDict()
+    for node in spec:
+        if 'root' in node:
+            for prefix, uri in node['root'].get('namespaces', {}).items():
+                ET.register_namespace(prefix, uri)
+        else:
+            _compileNode(node, builders)
+
+    # The spec is held so that its id is not reused while cached
+    _compiled[id(spec)] = (spec, builders)
+    return builders
+
+def _compileNode(node, builders):
+    """Compile a module node and its descendants into builders."""
+
+    nodeclass = node.get('class', CMLModule)
+    if not issubclass(nodeclass, CMLModule):
+        return
+
+    fixed = {}
+    accepted = []
+    required = []
+    recommended = []
+    messages = node.get('messages', {})
+    for name, value in sorted(node.get('attrib', {}).items()):
+        if value is True or value is False:
+            accepted.append(name)
+            if value:
+                required.append((name, messages.get(name,
+                                 "A %s attribute is required" % name)))
+            else:
+                recommended.append((name, messages.get(name,
+                                    "A %s attribute is recommended" % name)))
+        else:
+            fixed[name] = value
+
+    dictref = fixed.get('dictRef')
+    if not dictref:
+        raise CMLError, "A module of a convention requires a fixed dictRef"
+
+    # The builder is placed before those of its children so that the
+    # builders are in document order
+    name = dictref.split(':')[-1]
+    name = name[0].upper() + name[1:]
+    if name in builders:
+        raise CMLError, "More than one module of the convention is named %s" \
+                        % name
+    builders[name] = None
+
+    listclass = None
+    argnames = list(accepted)
+    for child in node.get('children', []):
+        if child.get('list') and issubclass(child['class'], AbstractList):
+            if 'parameters' in argnames:
+                raise CMLError, "The parameters argument of %s is taken" % name
+            listclass = child['class']
+            argnames.insert(0, 'parameters')
+        else:
+            _compileNode(child, builders)
+
+    attrs = {'fixed': fixed,
+             'argnames': tuple(argnames),
+             'required': tuple(required),
+             'recommended': tuple(recommended),
+             'listclass': listclass,
+             'dictref': dictref.split(':')[-1],
+             '__doc__': "Builder for %s modules compiled from a convention."
+                        % dictref}
+    if all(_IDENTIFIER.match(a) and not keyword.iskeyword(a) and
+           not a.startswith(_RESERVED) and a != 'None' for a in argnames):
+        attrs['__init__'] = _compileInit(name, attrs)
+    # Builders of nodes with their own module class are subclasses of it, so
+    # the modules they build are instances of that class
+    if issubclass(CompiledModule, nodeclass):
+        bases = (CompiledModule,)
+    else:
+        bases = (CompiledModule, nodeclass)
+    builders[name] = type(name, bases, attrs)
+
+def _compileInit(name, attrs):
+    """Return an __init__ for a builder generated from its class attributes.
+
+    The method takes each of argnames as an argument, so the arguments are
+    bound by Python rather than collected and checked as in
+    CompiledModule.__init__, and has a statement checking each required and
+    recommended attribute. Every other name used by the method, including
+    its first argument, starts with _RESERVED so that no attribute of the
+    spec can hide it.
+    """
+
+    p = _RESERVED
+    namespace = {p + 'fixed': attrs['fixed'], p + 'CMLError': CMLError,
+                 p + 'warn': warnings.warn, p + 'init': ET.Element.__init__,
+                 '__name__': __name__}
+    lines = ['def __init__(%s):' % ', '.join(
+                 [p + 'self'] + ['%s=None' % a for a in attrs['argnames']])]
+    checks = [(a, 'raise %sCMLError, %%s' % p, m)
+              for a, m in attrs['required']] + \
+             [(a, '%swarn(%%s, stacklevel=2)' % p, m)
+              for a, m in attrs['recommended']]
+    for i, (attribute, statement, message) in enumerate(checks):
+        variable = '%sm%d' % (p, i)
+        namespace[variable] = message
+        lines.append('    if %s is None: %s' % (attribute, statement % variable))
+    lines.append('    %sattrib = %sfixed.copy()' % (p, p))
+    for attribute in attrs['argnames']:
+        if attribute != 'parameters':
+            lines.append('    if %s is not None: %sattrib[%r] = %s' %
+                         (attribute, p, attribute, attribute))
+    lines += ['    %sinit(%sself, "module")' % (p, p),
+              '    %sself.attrib = %sattrib' % (p, p),
+              '    %sself.index = None' % p]
+    if 'parameters' in attrs['argnames']:
+        lines.append('    if parameters is not None and len(parameters):')
+        lines.append('        %sself.populate(parameters)' % p)
+
+    exec compile('\n'.join(lines) + '\n', '<%s builder>' % name, 'exec') \
+         in namespace
+    return namespace['__init__']
+
+class CompiledModule(CMLModule):
+    """Base class of the module builders produced by compileConvention.
+
+    Subclasses hold, as class attributes, the fixed attributes of the module,
+    the names of the arguments of the builder and the required and
+    recommended attributes with their messages. Positional arguments are the
+    parameters of the module, if it holds a parameter or property list,
+    followed by its required and recommended attributes in alphabetical
+    order, eg. Initialisation(parameters, title). compileConvention replaces
+    __init__ with one generated for each builder, unless an attribute name
+    is not a Python identifier.
+    """
+
+    fixed = {}
+    argnames = ()
+    required = ()
+    recommended = ()
+    listclass = None
+    dictref = None
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self.argnames):
+            raise TypeError, "%s takes at most %d arguments" % \
+                             (type(self).__name__, len(self.argnames))
+        values = dict(zip(self.argnames, args))
+        for name in kwargs:
+            if name not in self.argnames:
+                raise TypeError, "%s got an unexpected argument %s" % \
+                                 (type(self).__name__, name)
+        values.update(kwargs)
+
+        for name, message in self.required:
+            if values.get(name) is None:
+                raise CMLError, message
+        for name, message in self.recommended:
+            if values.get(name) is None:
+                warnings.warn(message, stacklevel=2)
+
+        parameters = values.pop('parameters', None)
+        attrib = self.fixed.copy()
+        for name, value in values.iteritems():
+            if value is not None:
+                attrib[name] = value
+
+        # The attributes are complete so the checks of CMLElement are skipped
+        ET.Element.__init__(self, 'module')
+        self.attrib = attrib
+        self.index = None
+        if parameters is not None and len(parameters):
+            self.populate(parameters)
+
+    def setIndex(self, index, path):
+        """Set a DictRefIndex to which populated lists will be added."""
+
+        self.index = index
+        self.indexpath = path
+        return self
+
+    def populate(self, parameters):
+        """Populate the module with a list of parameters or properties.
+
+        See AbstractList for the format of the parameters.
+        """
+
+        if self.listclass is None:
+            raise CMLError, "A %s module does not hold a list" % self.dictref
+        plist = self.listclass(parameters)
+        self.append(plist)
+        if self.index is not None:
+            self.index.add(plist, self.indexpath)
+        return self
@@ -11,30 +11,54 @@
 #
 #################################
 
+import mmap
+import re
 from pycml.pycml import *
+from pycml.conventions.compiler import compileConvention
+
+TITLE_MESSAGE = "A human readable title is recommended for compchem modules"
 
 class SimpleCompChem(CMLDoc):
     """A class representing a simple compchem CMLDocs.
 
     This class is currently limited to handling compchem compliant CMLDocs
     with only one job and the set of available modules limited to
-    initialisation and finalisation with the optional module environment."""
+    initialisation and finalisation with the optional module environment.
+
+    The modules are built by the builders compiled from convention, which
+    are subclasses of the module classes below and give the same elements.
+
+    The modules of the document are indexed as soon as they are created and
+    the parameter and property lists as the modules are populated, so values
+    can be found with find and getValue at any point eg.
+
+    >> doc.getValue('compchem:totalEnergy', 'jobsList/job/finalisation')
+    """
 
     def __init__(self, env=None):
         CMLDoc.__init__(self)
+        self.convention = convention
 
-        self._jobslist = JobsList()
-        self._job = Job()
-        self._initialisation = Initialisation()
-        self._finalisation = Finalisation()
+        self._jobslist = _builders['JobsList']()
+        self._job = _builders['Job']()
+        self._initialisation = _builders['Initialisation']()
+        self._finalisation = _builders['Finalisation']()
         if env:
-            self._environment = Environment()
+            self._environment = _builders['Environment']()
         else: self._environment = None
 
+        self.index.add(self._jobslist)
+        self.index.add(self._job, 'jobsList')
+        for module in [self._environment, self._initialisation,
+                       self._finalisation]:
+            if module is not None:
+                self.index.add(module, 'jobsList/job')
+                module.setIndex(self.index, 'jobsList/job/' + module.dictref)
+
         self.registerNamespace('compchem',
              'http://xml-cml.org/convention/compchem')
 
-    def write(self, fp):
+    def write(self, fp, payloads=None, processes=None):
         """Serialise the full tree and write out to a file.
 
         This function finalises the tree and writes it out to a file like
@@ -48,18 +72,86 @@ class SimpleCompChem(CMLDoc):
         
         :param :fp A file-like object that CML document will be serialised to
         :type :fp file
+        :param :payloads Optional store for the values of large arrays, see
+                         ExternalPayloads
+        :param :processes Optional number of processes to serialise the
+                          document concurrently, see CMLDoc.serialise
         :rtype: File-like object to which the tree has been written
         """
 
-        if self._environment:
-            self._job.append(self._environment)
-        self._job.append(self._initialisation)
-        self._job.append(self._finalisation)
-        self._jobslist.append(self._job)
-        self.cmlelements.append(self._jobslist)
-        self.serialise(fp)
+        self.getElements()
+        self.serialise(fp, payloads, processes)
         return fp
 
+    def getElements(self):
+        """Return the core element list, assembling the jobsList if needed.
+
+        The jobsList is appended to the document the first time it is needed
+        so that the document can be written, or snapshot, more than once.
+        """
+
+        if not len(self._jobslist):
+            self._jobslist.append(self._buildJob())
+        if not self.cmlelements:
+            self.cmlelements.append(self._jobslist)
+        return self.cmlelements
+
+    def stream(self, fp, elements, frames, precision=None):
+        """Write the document with a trajectory streamed into finalisation.
+
+        The document is written as for write but the frames yielded by frames
+        are written one at a time into a trajectory module at the end of the
+        finalisation module. Only a single frame is held in memory at any time
+        so this is suitable for optimisations and molecular dynamics runs with
+        many thousands of geometries.
+
+        :param :fp A file-like object that CML document will be serialised to
+        :type :fp file
+        :param :elements Element symbols of the atoms
+        :param :frames An iterable of coordinate arrays of shape (N, 3)
+        :param :precision Optional number of decimal places for coordinates
+        :rtype: File-like object to which the document has been written
+        """
+
+        writer = CMLStreamWriter(fp, self._root)
+        writer.startElement(self._jobslist)
+        writer.startElement(self._job)
+        if self._environment:
+            writer.writeElement(self._environment)
+        writer.writeElement(self._initialisation)
+        writer.startElement(self._finalisation)
+        for element in self._finalisation:
+            writer.writeElement(element)
+
+        trajectory = TrajectoryWriter(writer, elements,
+                                      {'dictRef': 'trajectory'}, precision)
+        trajectory.writeFrames(frames).close()
+        return writer.close()
+
+    def appendTo(self, filename):
+        """Append the job of this document to an existing CML file.
+
+        The existing file is not parsed, see appendJob for details. This allows
+        a series of calculations to be collected into one jobsList one job at a
+        time.
+
+        :param :filename The path of a SimpleCompChem CML file to append to
+        :type :filename str
+        """
+
+        appendJob(filename, self._buildJob())
+
+    def _buildJob(self):
+        """Assemble the job module from the environment, initialisation and
+        finalisation modules of the document."""
+
+        if not len(self._job):
+            if self._environment:
+                self._job.append(self._environment)
+            self._job.append(self._initialisation)
+            self._job.append(self._finalisation)
+        return self._job
+
     ######################################################################
     # Getters to encourage users not to interact with the internal variables
     # of the document but with the underlying elements with their exposed
@@ -140,9 +232,23 @@ class CoreSimpleCCModule(CompChemModule):
     def __init__(self, dictref, parameters=None, title=None):
         CompChemModule.__init__(self, dictref, title)
         self.dictref = dictref
-        if parameters:
+        self.index = None
+        if parameters is not None and len(parameters):
             self.populate(parameters)
 
+    def setIndex(self, index, path):
+        """Set a DictRefIndex to which populated lists will be added.
+
+        :param :index The index of the document containing the module
+        :type :index DictRefIndex
+        :param :path The module path of this module within the document
+        :type :path str
+        """
+
+        self.index = index
+        self.indexpath = path
+        return self
+
     def populate(self, parameters):
         """Populate the initialisation module with a parameter list and parameters.
 
@@ -158,6 +264,8 @@ class CoreSimpleCCModule(CompChemModule):
 
         plist = ListClass(parameters)
         self.append(plist)
+        if self.index is not None:
+            self.index.add(plist, self.indexpath)
         return self
 
 
@@ -174,14 +282,116 @@ class Finalisation(CoreSimpleCCModule):
 class Environment(CoreSimpleCCModule):
 
     def __init__(self, parameters=None, title=None):
-        CoresSimpleCCModule.__init__(self, 'environment', parameters, title)
-
-
-
-
-
-
-
+        CoreSimpleCCModule.__init__(self, 'environment', parameters, title)
+
+
+def _moduleSpec(dictref, required, moduleclass, listclass=None, children=()):
+    spec = {'required' : required,
+            'attrib'   : {'dictRef' : dictref,
+                          'title'   : False},
+            'messages' : {'title' : TITLE_MESSAGE},
+            'class'    : moduleclass,
+            'children' : list(children)}
+    if listclass:
+        spec['children'].append({'required' : False,
+                                 'list'     : True,
+                                 'class'    : listclass})
+    return spec
+
+# The simple compchem convention in the format described in
+# CMLDoc.getConvention. The modules of SimpleCompChem documents are built by
+# the builders compiled from it, see pycml.conventions.compiler.
+convention = [
+    {'root' : {'namespaces' : {'compchem' :
+                                   'http://xml-cml.org/convention/compchem'},
+               'convention' : 'convention:compchem'}},
+    _moduleSpec('jobsList', True, JobsList, children=[
+        _moduleSpec('job', True, Job, children=[
+            _moduleSpec('environment', False, Environment, PropertyList),
+            _moduleSpec('initialisation', True, Initialisation, ParameterList),
+            _moduleSpec('finalisation', True, Finalisation, PropertyList)])])]
+
+# The module builders used by SimpleCompChem, see compileConvention. Each is
+# a subclass of the module class of its node, eg. the Initialisation builder
+# of Initialisation, so the modules of a document are instances of those.
+_builders = compileConvention(convention)
 
 
+######################################################################
+#
+# Functions operating on serialised SimpleCompChem documents
+#
+######################################################################
 
+def appendJob(filename, job, blocksize=1024):
+    """Append a job module to the jobsList of an existing CML file.
+
+    Rather than parsing the existing document the end of the file is scanned
+    backwards for the closing tags of the jobsList module and the cml root
+    element. The new job is serialised in place of those closing tags which
+    are then written back after it. Only the tail of the file is rewritten so
+    the cost of writing depends on the size of the new job and not on the
+    size of the existing file. To check that the module closed is the
+    jobsList the module tags of the file, and only those, are found by a
+    regular expression over the memory mapped file, which is much faster
+    than parsing it.
+
+    :param :filename Path of a CML file with a jobsList as its last module
+    :type :filename str
+    :param :job The job module to append
+    :type :job Job
+    :param :blocksize Size of the blocks read when scanning backwards
+    :type :blocksize int
+    """
+
+    f = open(filename, 'r+b')
+    try:
+        f.seek(0, 2)
+        size = f.tell()
+        readsize = min(blocksize, size)
+        while True:
+            f.seek(size - readsize)
+            tail = f.read(readsize)
+            match = _JOBSLIST_TAIL.search(tail)
+            if match or readsize == size:
+                break
+            readsize = min(readsize * 2, size)
+
+        if not match or _lastModule(f) != 'jobsList':
+            raise CMLError, \
+                "%s does not end with a jobsList module and cml root" % filename
+
+        f.seek(size - readsize + match.start())
+        f.truncate()
+        f.write(ET.tostring(job, encoding='utf-8'))
+        f.write(match.group())
+    finally:
+        f.close()
+
+# The closing tag of the last module followed only by the close of the root
+_JOBSLIST_TAIL = re.compile(r'</module>\s*</(\w+:)?cml>\s*$')
+
+# The start and end tags of modules, and the dictRef of a start tag
+_MODULE_TAG = re.compile(r'<(/?)(?:\w+:)?module(?=[\s/>])([^>]*)>')
+_DICTREF = re.compile(r'\sdictRef\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+def _lastModule(f):
+    """Return the local dictRef of the last module that is not nested in
+    another module of a file, or None if it has none."""
+
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        depth = 0
+        last = None
+        for match in _MODULE_TAG.finditer(data):
+            closing, attributes = match.groups()
+            if closing:
+                depth -= 1
+            elif not attributes.endswith('/'):
+                if not depth:
+                    dictref = _DICTREF.search(attributes)
+                    last = dictref and (dictref.group(1) or dictref.group(2))
+                depth += 1
+        return last.split(':')[-1] if last else None
+    finally:
+        data.close()
@@ -0,0 +1,181 @@
+# pyCML.convert: Command line conversion of parameter dumps to CML
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+# NumPy is only imported if an input holds arrays or matrices.
+#
+#################################
+
+from __future__ import absolute_import
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import warnings
+
+from pycml.pycml import CMLError
+from pycml.conventions.simple_comp_chem import SimpleCompChem, TITLE_MESSAGE
+
+# The modules of a SimpleCompChem document that can be populated
+MODULES = ('environment', 'initialisation', 'finalisation')
+
+def readParameters(path, module='finalisation'):
+    """Read the parameters and properties of a document from a JSON or CSV file.
+
+    A JSON file holds either an object mapping module names to lists of
+    dictionaries in the format described in AbstractList, eg.
+
+    {"initialisation": [{"value": "b3lyp",
+                         "attrib": {"dictRef": "compchem:method",
+                                    "units": "si:none"}}],
+     "finalisation": [...]}
+
+    or a single such list which is placed in module. Nested lists are read
+    as matrices.
+
+    A CSV file has a header row naming its columns, which must include
+    dictRef, units and value and may include module. Values are read as
+    ints, floats, booleans (true or false) or strings, and values made up of
+    several whitespace separated numbers as arrays.
+
+    :param :path The path of a .json or .csv file
+    :param :module The module for values that do not name one
+    :return: A dictionary mapping module names to lists of parameters
+    :rtype: dict
+    """
+
+    if path.lower().endswith('.csv'):
+        modules = _readCSV(path, module)
+    else:
+        f = open(path, 'rb')
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        if isinstance(data, list):
+            data = {module: data}
+        if not isinstance(data, dict):
+            raise CMLError, "Expected a list or an object of lists"
+        modules = {}
+        for name, paramlist in data.iteritems():
+            modules[str(name)] = [_readJSONParameter(p) for p in paramlist]
+
+    for name in modules:
+        if name not in MODULES:
+            raise CMLError, "Unknown module %s" % name
+    return modules
+
+def convert(path, output, module='finalisation'):
+    """Convert a JSON or CSV file to a SimpleCompChem CML file.
+
+    The inputs give no titles for the modules of the document so the
+    warnings recommending them are not shown.
+
+    :param :path The path of the input, see readParameters
+    :param :output The path of the CML file to write
+    :param :module The module for values that do not name one
+    """
+
+    modules = readParameters(path, module)
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', re.escape(TITLE_MESSAGE))
+        doc = SimpleCompChem(env='environment' in modules)
+    for name in MODULES:
+        if modules.get(name):
+            getattr(doc, name)().populate(modules[name])
+
+    f = open(output, 'wb')
+    try:
+        doc.write(f)
+    finally:
+        f.close()
+    return output
+
+def _readJSONParameter(param):
+    try:
+        value = param['value']
+        attrib = param['attrib']
+    except (KeyError, TypeError):
+        raise CMLError, "Parameters require a value and attrib"
+    if isinstance(value, list) and value and isinstance(value[0], list):
+        import numpy
+        value = numpy.array(value)
+    parameter = {'value': value, 'attrib': dict((str(k), v) for k, v in
+                                                attrib.iteritems())}
+    if 'release' in param:
+        parameter['release'] = param['release']
+    return parameter
+
+def _readCSV(path, module):
+    modules = {}
+    f = open(path, 'rb')
+    try:
+        for row in csv.DictReader(f):
+            try:
+                parameter = {'value': _parseValue(row['value']),
+                             'attrib': {'dictRef': row['dictRef'],
+                                        'units': row['units']}}
+            except KeyError, e:
+                raise CMLError, "CSV input requires a %s column" % e.args[0]
+            modules.setdefault(row.get('module') or module,
+                               []).append(parameter)
+    finally:
+        f.close()
+    return modules
+
+def _parseValue(text):
+    """Parse the text of a CSV value as the narrowest type that holds it."""
+
+    tokens = text.split()
+    if len(tokens) == 1:
+        if tokens[0] in ('true', 'false'):
+            return tokens[0] == 'true'
+    elif not tokens:
+        return text
+
+    for parser in (int, float):
+        try:
+            values = [parser(token) for token in tokens]
+        except ValueError:
+            continue
+        return values[0] if len(values) == 1 else values
+    return text
+
+def main(argv=None):
+    """Command line interface, exits with status 1 if any input failed."""
+
+    parser = argparse.ArgumentParser(
+        description='Convert JSON or CSV parameter and property dumps to '
+                    'SimpleCompChem CML documents')
+    parser.add_argument('inputs', nargs='+', metavar='input',
+                        help='JSON (.json) or CSV (.csv) files to convert')
+    parser.add_argument('-o', '--output-dir',
+                        help='directory for the CML files, by default the '
+                             'directory of each input')
+    parser.add_argument('-m', '--module', choices=MODULES,
+                        default='finalisation',
+                        help='module for values that do not name one')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for path in args.inputs:
+        directory = args.output_dir or os.path.dirname(path)
+        name = os.path.splitext(os.path.basename(path))[0] + '.cml'
+        try:
+            convert(path, os.path.join(directory, name), args.module)
+        except (CMLError, EnvironmentError, ValueError), e:
+            sys.stderr.write('pycml: %s: %s\n' % (path, e))
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# pyCML.converters: Conversion of quantum chemistry program output to CML
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+# Each program has a LogParser, see pycml.converters.base, registered under
+# the name of the program. The parsers for Gaussian, ORCA and NWChem are
+# registered when this package is imported and others may be added with
+# registerParser.
+#
+#################################
+
+from __future__ import absolute_import
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+
+from pycml.pycml import CMLError
+from pycml.converters.base import LogParser, detectParser, getParser, \
+                                  registerParser
+from pycml.converters import gaussian, nwchem, orca
+
+# The number of lines at the start of a log searched for a parser signature
+DETECT_LINES = 200
+
+# File extensions of the logs converted by convertDirectory
+EXTENSIONS = ('.log', '.out')
+
+def convertLog(path, output=None, program=None):
+    """Convert the output of a program to a SimpleCompChem CML file.
+
+    The log is read once, a line at a time, so its size is not limited by
+    memory. Unless program is given the parser is chosen by searching the
+    first lines of the log for the signature of each registered parser.
+
+    :param :path The path of the log
+    :param :output The path of the CML file, by default that of the log with
+                   the extension .cml
+    :param :program The name of a registered parser eg. 'gaussian'
+    :return: The path of the CML file written
+    :rtype: str
+    """
+
+    if output is None:
+        output = os.path.splitext(path)[0] + '.cml'
+
+    log = open(path, 'rU')
+    try:
+        head = list(itertools.islice(log, DETECT_LINES))
+        if program:
+            parserclass = getParser(program)
+        else:
+            parserclass = detectParser(head)
+            if parserclass is None:
+                raise CMLError, "Unrecognised program output %s" % path
+
+        parser = parserclass()
+        for line in itertools.chain(head, log):
+            parser.feed(line)
+    finally:
+        log.close()
+
+    doc = parser.buildDocument()
+    f = open(output, 'wb')
+    try:
+        doc.write(f)
+    finally:
+        f.close()
+    return output
+
+def convertDirectory(directory, outdir=None, program=None, processes=None):
+    """Convert every log in a directory using a pool of processes.
+
+    Logs are the files with an extension in EXTENSIONS. A log that can not be
+    converted does not stop the conversion of the others.
+
+    :param :directory The directory containing the logs
+    :param :outdir The directory for the CML files, by default directory
+    :param :program The name of a registered parser, by default detected
+    :param :processes The number of processes, by default one per CPU
+    :return: A list of (log path, CML path, error message) tuples, with the
+             CML path None and the error message set for failed logs
+    :rtype: list
+    """
+
+    outdir = outdir or directory
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        base, extension = os.path.splitext(name)
+        if extension.lower() in EXTENSIONS:
+            jobs.append((os.path.join(directory, name),
+                         os.path.join(outdir, base + '.cml'), program))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_convertJob, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def _convertJob(job):
+    path, output, program = job
+    try:
+        return path, convertLog(path, output, program), None
+    except (CMLError, EnvironmentError, ValueError), e:
+        return path, None, str(e)
+
+def main(argv=None):
+    """Command line interface, exits with status 1 if any log failed."""
+
+    parser = argparse.ArgumentParser(
+        description='Convert Gaussian, ORCA or NWChem output to '
+                    'SimpleCompChem CML documents')
+    parser.add_argument('inputs', nargs='+', metavar='input',
+                        help='log files, or directories of .log and .out files')
+    parser.add_argument('-o', '--output-dir',
+                        help='directory for the CML files, by default the '
+                             'directory of each log')
+    parser.add_argument('-p', '--program',
+                        help='program that wrote the logs, by default detected')
+    parser.add_argument('-j', '--processes', type=int,
+                        help='number of processes used for directories')
+    args = parser.parse_args(argv)
+
+    results = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            results.extend(convertDirectory(path, args.output_dir,
+                                            args.program, args.processes))
+            continue
+        directory = args.output_dir or os.path.dirname(path)
+        name = os.path.splitext(os.path.basename(path))[0] + '.cml'
+        results.append(_convertJob((path, os.path.join(directory, name),
+                                    args.program)))
+
+    status = 0
+    for path, output, error in results:
+        if error is not None:
+            sys.stderr.write('pycml-logs: %s: %s\n' % (path, error))
+            status = 1
+    return status
@@ -0,0 +1,158 @@
+# pyCML.converters.base: Line parsers for quantum chemistry program output
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import collections
+import re
+import types
+
+from pycml.pycml import CMLError, Molecule
+from pycml.conventions.simple_comp_chem import SimpleCompChem
+
+# Element symbols indexed by atomic number
+SYMBOLS = ('X',
+    'H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Na', 'Mg', 'Al',
+    'Si', 'P', 'S', 'Cl', 'Ar', 'K', 'Ca', 'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe',
+    'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr',
+    'Y', 'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn',
+    'Sb', 'Te', 'I', 'Xe')
+
+# Registry of LogParser classes in the order they were registered
+_parsers = collections.OrderedDict()
+
+def registerParser(parserclass):
+    """Register a LogParser subclass under its program name.
+
+    Returns the class so that this can be applied as a decorator.
+    """
+
+    _parsers[parserclass.program] = parserclass
+    return parserclass
+
+def getParser(program):
+    """Return the registered LogParser class for a program."""
+
+    try:
+        return _parsers[program]
+    except KeyError:
+        raise CMLError, "No parser registered for %s" % program
+
+def detectParser(lines):
+    """Return the LogParser class whose signature is found in lines or None.
+
+    :param :lines The first lines of a log
+    :type :lines list
+    """
+
+    for parserclass in _parsers.itervalues():
+        for line in lines:
+            if parserclass.signature in line:
+                return parserclass
+    return None
+
+def rule(trigger, pattern, method):
+    """Return a rule for LogParser.rules with its pattern compiled."""
+
+    return trigger, re.compile(pattern), method
+
+class LogParser:
+    """Base class for parsers of the text output of a program.
+
+    A log is fed to the parser one line at a time with feed, so a log is read
+    once and never held in memory. Each parser lists its rules as a sequence
+    of (trigger, pattern, method name) tuples. The regular expression pattern
+    is only tried on lines containing the trigger string, which keeps the
+    cost of lines that match no rule to a few substring tests, and when it
+    matches the named method is called with the match.
+
+    Values spread over several lines, such as tables of coordinates, are read
+    by methods written as generators. When a rule method returns a generator
+    the lines that follow are sent to it, rather than tested against the
+    rules, until it returns.
+
+    Values are recorded with setParameter and setProperty against their
+    compchem dictRef. A value seen again, eg. the energy at each step of an
+    optimisation, replaces the earlier value so that the final value is kept.
+    Likewise only the last geometry is kept, see setGeometry.
+
+    Subclasses set program, signature (a string found near the start of
+    every log from the program) and rules, and are registered with
+    registerParser.
+    """
+
+    program = None
+    signature = None
+    rules = ()
+
+    def __init__(self):
+        self.parameters = collections.OrderedDict()
+        self.properties = collections.OrderedDict()
+        self.elements = None
+        self.coords = None
+        self._block = None
+
+    def feed(self, line):
+        """Parse a single line of the log."""
+
+        if self._block is not None:
+            try:
+                self._block.send(line)
+                return
+            except StopIteration:
+                self._block = None
+                return
+
+        for trigger, pattern, method in self.rules:
+            if trigger not in line:
+                continue
+            match = pattern.search(line)
+            if match is None:
+                continue
+            block = getattr(self, method)(match)
+            if isinstance(block, types.GeneratorType):
+                block.next()
+                self._block = block
+            return
+
+    def setParameter(self, dictref, value, units='si:none'):
+        self.parameters['compchem:' + dictref] = (value, units)
+
+    def setProperty(self, dictref, value, units='si:none'):
+        self.properties['compchem:' + dictref] = (value, units)
+
+    def setGeometry(self, elements, coords):
+        """Record the element symbols and coordinates (Angstrom) of the atoms."""
+
+        self.elements = elements
+        self.coords = coords
+
+    def buildDocument(self):
+        """Return a SimpleCompChem document holding the values parsed.
+
+        Parameters are placed in initialisation and properties and the final
+        geometry, as a molecule, in finalisation.
+        """
+
+        doc = SimpleCompChem()
+        for values, module in ((self.parameters, doc.initialisation()),
+                               (self.properties, doc.finalisation())):
+            if values:
+                module.populate([{'value': value,
+                                  'attrib': {'dictRef': dictref,
+                                             'units': units}}
+                                 for dictref, (value, units)
+                                 in values.iteritems()])
+        if self.coords:
+            doc.finalisation().append(Molecule(self.elements, self.coords))
+        return doc
@@ -0,0 +1,107 @@
+# pyCML.converters.gaussian: Parser for Gaussian output
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+from pycml.converters.base import LogParser, SYMBOLS, registerParser, rule
+
+class GaussianParser(LogParser):
+    """Parser for the log files of Gaussian 03, 09 and 16."""
+
+    program = 'gaussian'
+    signature = 'Entering Gaussian System'
+    rules = (
+        rule(' #', r'^ #\w*\s+(.*)', 'readRoute'),
+        rule('Multiplicity', r'Charge =\s*(-?\d+) Multiplicity =\s*(\d+)',
+             'readChargeMultiplicity'),
+        rule('SCF Done', r'SCF Done:\s+E\(\S+\) =\s+(\S+)', 'readSCFEnergy'),
+        rule('orientation:', r'(Standard|Input) orientation:',
+             'readOrientation'),
+        rule('eigenvalues', r'Alpha\s+(occ|virt)\. eigenvalues --(.*)',
+             'readEigenvalues'),
+        rule('Mulliken', r'^ Mulliken charges', 'readMulliken'),
+        rule('Dipole moment', r'^ Dipole moment', 'readDipole'),
+        rule('Zero-point correction', r'Zero-point correction=\s+(\S+)',
+             'readZPE'),
+        )
+
+    def __init__(self):
+        LogParser.__init__(self)
+        self._eigenvalues = []
+        self._virtual = False
+
+    def readRoute(self, match):
+        for keyword in match.group(1).split():
+            if '/' in keyword and not keyword.startswith('/'):
+                method, basis = keyword.split('/', 1)
+                self.setParameter('method', method)
+                self.setParameter('basis', basis)
+                return
+
+    def readChargeMultiplicity(self, match):
+        self.setParameter('charge', int(match.group(1)))
+        self.setParameter('multiplicity', int(match.group(2)))
+
+    def readSCFEnergy(self, match):
+        energy = float(match.group(1))
+        self.setProperty('scfEnergy', energy, 'nonsi:hartree')
+        self.setProperty('totalEnergy', energy, 'nonsi:hartree')
+
+    def readOrientation(self, match):
+        for header in range(4):
+            line = yield
+        elements = []
+        coords = []
+        while True:
+            line = yield
+            if line.startswith(' ---'):
+                break
+            fields = line.split()
+            elements.append(SYMBOLS[int(fields[1])])
+            coords.append([float(x) for x in fields[-3:]])
+        self.setGeometry(elements, coords)
+
+    def readEigenvalues(self, match):
+        # Each population analysis starts a new set of eigenvalues
+        occupied = match.group(1) == 'occ'
+        if occupied and self._virtual:
+            self._eigenvalues = []
+        self._virtual = not occupied
+        # Values are printed in fixed width fields, after a single space,
+        # which may run together
+        text = match.group(2)[1:].rstrip()
+        self._eigenvalues.extend(float(text[i:i + 10])
+                                 for i in xrange(0, len(text), 10))
+        self.setProperty('orbitalEnergies', self._eigenvalues,
+                         'nonsi:hartree')
+
+    def readMulliken(self, match):
+        line = yield
+        charges = []
+        while True:
+            line = yield
+            if 'Sum of Mulliken' in line:
+                break
+            charges.append(float(line.split()[2]))
+        self.setProperty('mullikenCharges', charges)
+
+    def readDipole(self, match):
+        line = yield
+        fields = line.split()
+        self.setProperty('dipoleMoment',
+                         [float(fields[i]) for i in (1, 3, 5)], 'nonsi:debye')
+
+    def readZPE(self, match):
+        self.setProperty('zpe', float(match.group(1)), 'nonsi:hartree')
+
+registerParser(GaussianParser)
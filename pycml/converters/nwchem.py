@@ -0,0 +1,111 @@
+# pyCML.converters.nwchem: Parser for NWChem output
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+from pycml.converters.base import LogParser, registerParser, rule
+
+class NWChemParser(LogParser):
+    """Parser for the output files of NWChem SCF and DFT calculations.
+
+    Mulliken charges are calculated from the nuclear charges and the gross
+    populations printed by NWChem.
+    """
+
+    program = 'nwchem'
+    signature = 'Northwest Computational Chemistry Package'
+    rules = (
+        rule('Output coordinates in angstroms',
+             r'^ Output coordinates in angstroms', 'readCoordinates'),
+        rule('Summary of "ao basis"', r'^ Summary of "ao basis"', 'readBasis'),
+        rule('NWChem SCF Module', r'NWChem SCF Module', 'readSCFModule'),
+        rule('Method XC Potential', r'^\s+(\S+) Method XC Potential',
+             'readXCMethod'),
+        rule('Charge', r'^\s+Charge\s+:\s+(-?\d+)', 'readCharge'),
+        rule('multiplicity', r'^\s+Spin multiplicity:\s+(\d+)',
+             'readMultiplicity'),
+        rule('energy =', r'^\s+Total (DFT|SCF) energy =\s+(\S+)',
+             'readEnergy'),
+        rule('Molecular Orbital Analysis', r'Final Molecular Orbital Analysis',
+             'readOrbitalAnalysis'),
+        rule('Vector', r'^ Vector\s+\d+\s+Occ=\S+\s+E=\s*(\S+)', 'readVector'),
+        rule('Mulliken analysis of the total density',
+             r'Mulliken analysis of the total density', 'readMulliken'),
+        rule('Zero-Point correction',
+             r'Zero-Point correction to Energy\s+=.*\(\s*(\S+) au\)',
+             'readZPE'),
+        )
+
+    def readCoordinates(self, match):
+        for header in range(3):
+            line = yield
+        elements = []
+        coords = []
+        while True:
+            line = yield
+            fields = line.split()
+            if not fields:
+                break
+            elements.append(fields[1])
+            coords.append([float(x) for x in fields[3:6]])
+        self.setGeometry(elements, coords)
+
+    def readBasis(self, match):
+        for header in range(3):
+            line = yield
+        line = yield
+        self.setParameter('basis', line.split()[1])
+        while line.strip():
+            line = yield
+
+    def readSCFModule(self, match):
+        self.setParameter('method', 'HF')
+
+    def readXCMethod(self, match):
+        self.setParameter('method', match.group(1))
+
+    def readCharge(self, match):
+        self.setParameter('charge', int(match.group(1)))
+
+    def readMultiplicity(self, match):
+        self.setParameter('multiplicity', int(match.group(1)))
+
+    def readEnergy(self, match):
+        energy = float(match.group(2))
+        self.setProperty('scfEnergy', energy, 'nonsi:hartree')
+        self.setProperty('totalEnergy', energy, 'nonsi:hartree')
+
+    def readOrbitalAnalysis(self, match):
+        self.setProperty('orbitalEnergies', [], 'nonsi:hartree')
+
+    def readVector(self, match):
+        orbitals = self.properties.get('compchem:orbitalEnergies')
+        if orbitals is not None:
+            orbitals[0].append(float(match.group(1).replace('D', 'E')))
+
+    def readMulliken(self, match):
+        for header in range(4):
+            line = yield
+        charges = []
+        while True:
+            line = yield
+            fields = line.split()
+            if not fields:
+                break
+            charges.append(round(float(fields[2]) - float(fields[3]), 6))
+        self.setProperty('mullikenCharges', charges)
+
+    def readZPE(self, match):
+        self.setProperty('zpe', float(match.group(1)), 'nonsi:hartree')
+
+registerParser(NWChemParser)
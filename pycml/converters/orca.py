@@ -0,0 +1,119 @@
+# pyCML.converters.orca: Parser for ORCA output
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import re
+
+from pycml.converters.base import LogParser, registerParser, rule
+
+# Debye per atomic unit of dipole moment
+DEBYE_PER_AU = 2.541746473
+
+class OrcaParser(LogParser):
+    """Parser for the output files of ORCA 3 and 4.
+
+    The method and basis set are taken from the simple input line echoed at
+    the top of the output. ORCA keywords may be given in any order so the
+    basis set is recognised by name and the method is taken to be the first
+    remaining keyword that is not a job type.
+    """
+
+    program = 'orca'
+    signature = '* O   R   C   A *'
+    basis = re.compile(r'^(def2-|ma-def2|def-|(aug-)?cc-p|6-31|6-311|3-21|sto-'
+                       r'|pc-|ano-)', re.I)
+    jobtypes = set(['sp', 'opt', 'copt', 'zopt', 'freq', 'numfreq', 'md',
+                    'engrad', 'rijcosx', 'ri', 'tightscf', 'verytightscf',
+                    'loosescf', 'normalscf', 'tightopt', 'largeprint',
+                    'miniprint', 'smallprint', 'printbasis'])
+    rules = (
+        rule('> !', r'^\|\s*\d+> !(.*)', 'readKeywords'),
+        rule('> *', r'^\|\s*\d+> \*\s*(xyz|int|gzmt)\s+(-?\d+)\s+(\d+)',
+             'readChargeMultiplicity'),
+        rule('CARTESIAN COORDINATES (ANGSTROEM)',
+             r'^CARTESIAN COORDINATES \(ANGSTROEM\)', 'readCoordinates'),
+        rule('Total Energy', r'^Total Energy\s+:\s+(\S+) Eh', 'readSCFEnergy'),
+        rule('FINAL SINGLE POINT ENERGY',
+             r'^FINAL SINGLE POINT ENERGY\s+(\S+)', 'readTotalEnergy'),
+        rule('ORBITAL ENERGIES', r'^ORBITAL ENERGIES', 'readOrbitals'),
+        rule('MULLIKEN ATOMIC CHARGES', r'^MULLIKEN ATOMIC CHARGES',
+             'readMulliken'),
+        rule('Total Dipole Moment',
+             r'^Total Dipole Moment\s+:\s+(\S+)\s+(\S+)\s+(\S+)', 'readDipole'),
+        rule('Zero point energy', r'^Zero point energy\s+\.\.\.\s+(\S+) Eh',
+             'readZPE'),
+        )
+
+    def readKeywords(self, match):
+        for keyword in match.group(1).split():
+            if self.basis.match(keyword):
+                self.setParameter('basis', keyword)
+            elif keyword.lower() not in self.jobtypes and \
+                 'compchem:method' not in self.parameters:
+                self.setParameter('method', keyword)
+
+    def readChargeMultiplicity(self, match):
+        self.setParameter('charge', int(match.group(2)))
+        self.setParameter('multiplicity', int(match.group(3)))
+
+    def readCoordinates(self, match):
+        line = yield
+        elements = []
+        coords = []
+        while True:
+            line = yield
+            fields = line.split()
+            if not fields:
+                break
+            elements.append(fields[0])
+            coords.append([float(x) for x in fields[1:4]])
+        self.setGeometry(elements, coords)
+
+    def readSCFEnergy(self, match):
+        self.setProperty('scfEnergy', float(match.group(1)), 'nonsi:hartree')
+
+    def readTotalEnergy(self, match):
+        self.setProperty('totalEnergy', float(match.group(1)), 'nonsi:hartree')
+
+    def readOrbitals(self, match):
+        for header in range(3):
+            line = yield
+        energies = []
+        while True:
+            line = yield
+            fields = line.split()
+            if not fields:
+                break
+            energies.append(float(fields[2]))
+        self.setProperty('orbitalEnergies', energies, 'nonsi:hartree')
+
+    def readMulliken(self, match):
+        line = yield
+        charges = []
+        while True:
+            line = yield
+            if line.startswith('Sum of atomic charges'):
+                break
+            charges.append(float(line.split(':')[1]))
+        self.setProperty('mullikenCharges', charges)
+
+    def readDipole(self, match):
+        self.setProperty('dipoleMoment',
+                         [float(x) * DEBYE_PER_AU for x in match.groups()],
+                         'nonsi:debye')
+
+    def readZPE(self, match):
+        self.setProperty('zpe', float(match.group(1)), 'nonsi:hartree')
+
+registerParser(OrcaParser)
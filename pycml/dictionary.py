@@ -0,0 +1,218 @@
+# pyCML.dictionary: Loading of CML dictionaries and validation of references
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import collections
+import cPickle
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+
+from pycml.pycml import CMLDoc, CMLError, iterparse
+
+# A reference in a document that could not be found in the dictionaries
+Problem = collections.namedtuple('Problem', 'tag attribute value message')
+
+class CMLDictionaries:
+    """A set of CML dictionaries compiled for fast lookup of references.
+
+    CML documents refer to dictionary entries through dictRef attributes and
+    to units through units attributes, both of the form prefix:id. This class
+    loads CML dictionary files (dictionary elements containing entry elements)
+    and unit dictionary files (unitList elements containing unit elements)
+    from local paths and compiles them into hashed sets of the references
+    they define so that each reference in a document can be checked with a
+    single lookup.
+
+    Parsing a dictionary is much slower than loading the compiled form so if
+    a cachedir is given the compiled form of each file is cached there and
+    reused for as long as the file is unchanged. The cache is off by default.
+    The cached files are pickles, which are loaded as they are found, so
+    cachedir must be a directory that only trusted users can write to.
+
+    :param :paths Paths of the dictionary files to load
+    :type :paths list
+    :param :cachedir Optional directory for the compiled dictionaries
+    :type :cachedir str
+    """
+
+    def __init__(self, paths=(), cachedir=None):
+        self.cachedir = cachedir
+        self.prefixes = set()
+        self.entries = set()
+        self.units = {}
+        for path in paths:
+            self.load(path)
+
+    def load(self, path):
+        """Load a dictionary file, from the cache if it is up to date.
+
+        :param :path Path of a CML dictionary or unit dictionary file
+        :type :path str
+        """
+
+        compiled = self._loadCached(path)
+        if compiled is None:
+            compiled = compileDictionary(path)
+            self._saveCached(path, compiled)
+
+        prefix, entries, units = compiled
+        self.prefixes.add(prefix)
+        self.entries.update(entries)
+        self.units.update(units)
+        return self
+
+    def hasEntry(self, ref):
+        """Return True if a dictRef refers to a loaded dictionary entry."""
+
+        return ref in self.entries
+
+    def hasUnit(self, ref):
+        """Return True if a units reference refers to a loaded unit."""
+
+        return ref in self.units
+
+    def unit(self, ref):
+        """Return the attributes of the unit definition for a units reference.
+
+        :rtype: dict
+        """
+
+        try:
+            return self.units[ref]
+        except KeyError:
+            raise CMLError, "Unknown unit %s" % ref
+
+    def validate(self, source, strict=False):
+        """Check every dictRef and units reference of a document in one pass.
+
+        References whose prefix is not that of a loaded dictionary are only
+        reported if strict is True, which allows documents mixing several
+        dictionaries to be checked against only some of them.
+
+        :param :source A CMLDoc, an element, or a path or file object of a
+                       serialised CML document which is parsed as a stream
+        :param :strict Report references to dictionaries that are not loaded
+        :type :strict bool
+        :return: A list of the problems found, empty for a valid document
+        :rtype: list of Problem
+        """
+
+        problems = []
+        for element in _iterElements(source):
+            for attribute, known in (('dictRef', self.entries),
+                                     ('units', self.units)):
+                ref = element.get(attribute)
+                if ref is None or ref in known:
+                    continue
+                prefix = ref.split(':', 1)[0] if ':' in ref else None
+                if prefix in self.prefixes:
+                    message = "%s is not defined in dictionary %s" % (ref,
+                                                                      prefix)
+                elif strict:
+                    message = "No dictionary loaded for %s" % ref
+                else:
+                    continue
+                problems.append(Problem(_localName(element.tag), attribute,
+                                        ref, message))
+        return problems
+
+    def _cachePath(self, path):
+        key = hashlib.sha1(os.path.abspath(path)).hexdigest()
+        return os.path.join(self.cachedir, key + '.pickle')
+
+    def _loadCached(self, path):
+        if not self.cachedir:
+            return None
+        stat = os.stat(path)
+        try:
+            f = open(self._cachePath(path), 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                mtime, size, compiled = cPickle.load(f)
+            except Exception:
+                return None
+        finally:
+            f.close()
+        if (mtime, size) != (stat.st_mtime, stat.st_size):
+            return None
+        return compiled
+
+    def _saveCached(self, path, compiled):
+        if not self.cachedir:
+            return
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        stat = os.stat(path)
+        cachepath = self._cachePath(path)
+        # Write to a temporary file and rename so that concurrent runs never
+        # see a partially written cache
+        temppath = '%s.%d' % (cachepath, os.getpid())
+        f = open(temppath, 'wb')
+        try:
+            cPickle.dump((stat.st_mtime, stat.st_size, compiled), f, 2)
+        finally:
+            f.close()
+        os.rename(temppath, cachepath)
+
+def compileDictionary(path):
+    """Parse a CML dictionary file into its prefix, entries and units.
+
+    :param :path Path of a CML dictionary or unit dictionary file
+    :return: The dictionary prefix, a set of the prefix:id references of its
+             entries and a dictionary of the attributes of its units keyed by
+             their prefix:id references
+    :rtype: tuple
+    """
+
+    prefix = None
+    entries = set()
+    units = {}
+    for event, element in iterparse(path):
+        if event != 'start':
+            continue
+
+        tag = _localName(element.tag)
+        if tag in ('dictionary', 'unitList') and prefix is None:
+            prefix = element.get('dictionaryPrefix')
+            if not prefix:
+                raise CMLError, "%s has no dictionaryPrefix" % path
+        elif tag == 'entry' and element.get('id'):
+            entries.add('%s:%s' % (prefix, element.get('id')))
+        elif tag == 'unit' and element.get('id'):
+            units['%s:%s' % (prefix, element.get('id'))] = dict(element.attrib)
+
+    if prefix is None:
+        raise CMLError, "%s is not a CML dictionary" % path
+    return prefix, entries, units
+
+def _localName(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _iterElements(source):
+    """Iterate over the elements of a document, tree or serialised file."""
+
+    if isinstance(source, CMLDoc):
+        for element in source.getElements():
+            for e in element.iter():
+                yield e
+    elif isinstance(source, ET.Element):
+        for e in source.iter():
+            yield e
+    else:
+        for event, element in iterparse(source):
+            if event == 'start':
+                yield element
@@ -0,0 +1,187 @@
+# pyCML.diff: Streaming structural comparison of CML documents
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import argparse
+import collections
+import itertools
+import os
+import sys
+
+import numpy
+
+from pycml.pycml import CMLError, decodeValue, iterparse
+
+# A difference between two documents. kind is one of added, removed or
+# changed, path is the module path of the element and old and new are the
+# (value, units) of the element in each document, None if it is absent.
+Difference = collections.namedtuple('Difference',
+                                    'kind path dictref old new')
+
+def diff(old, new, rtol=1e-9, atol=0.0):
+    """Compare two serialised CML documents and yield their differences.
+
+    Both documents are parsed as streams in parallel. Modules, parameters and
+    properties are matched by their module path, dictRef and position among
+    elements with the same path and dictRef, so reordering within a module
+    is tolerated. Values are compared with their units; numeric scalars,
+    arrays and matrices are compared with numpy.allclose using rtol and atol
+    so that each array is compared in a single vectorised step.
+
+    Elements that can not yet be matched are held until their partner is
+    reached in the other document, so the memory used depends on how far the
+    two documents are out of step and not on their size. Elements never
+    matched are reported as removed or added once both documents have been
+    read.
+
+    :param :old A path or file object of the reference document
+    :param :new A path or file object of the document compared to it
+    :param :rtol Relative tolerance for numeric values
+    :param :atol Absolute tolerance for numeric values
+    :return: A generator of Difference tuples
+    """
+
+    pending = ({}, {})
+    streams = [_items(old), _items(new)]
+    for pair in itertools.izip_longest(*streams):
+        for side, item in enumerate(pair):
+            if item is None:
+                continue
+            key, value = item
+            other = pending[1 - side]
+            if key not in other:
+                pending[side][key] = value
+                continue
+
+            matched = other.pop(key)
+            oldvalue, newvalue = (value, matched) if side == 0 \
+                                                  else (matched, value)
+            if not _equal(oldvalue, newvalue, rtol, atol):
+                yield Difference('changed', key[0], key[1], oldvalue, newvalue)
+
+    for kind, side in (('removed', 0), ('added', 1)):
+        for key, value in sorted(pending[side].items()):
+            yield Difference(kind, key[0], key[1],
+                             value if side == 0 else None,
+                             value if side == 1 else None)
+
+def _items(source):
+    """Yield ((path, dictRef, n), (value, units)) for a document.
+
+    n counts the earlier elements with the same path and dictRef. Modules
+    have a value of None. Elements are recognised by their tags without
+    namespaces.
+    """
+
+    directory = os.path.dirname(source) if isinstance(source, basestring) \
+                                        else ''
+    path = []
+    modules = []
+    counts = collections.defaultdict(int)
+    subtrees = ('parameter', 'property')
+    for event, element in iterparse(source, subtrees):
+        tag = element.tag.rsplit('}', 1)[-1]
+        dictref = element.get('dictRef')
+        if tag == 'module':
+            if event == 'start':
+                modules.append(dictref)
+                if dictref:
+                    key = ('/'.join(path), dictref)
+                    yield key + (counts[key],), (None, None)
+                    counts[key] += 1
+                    path.append(dictref.split(':')[-1])
+            elif modules.pop():
+                path.pop()
+
+        elif tag in subtrees and event == 'end' and dictref:
+            key = ('/'.join(path), dictref)
+            try:
+                value = decodeValue(element, directory)
+            except CMLError:
+                value = None
+            units = None
+            for child in element:
+                units = child.get('units')
+            yield key + (counts[key],), (value, units)
+            counts[key] += 1
+
+def _equal(old, new, rtol, atol):
+    """Compare two (value, units) pairs."""
+
+    if old[1] != new[1]:
+        return False
+    a = numpy.asarray(old[0])
+    b = numpy.asarray(new[0])
+    if a.shape != b.shape:
+        return False
+    return not numpy.any(_differing(a, b, rtol, atol))
+
+def _differing(a, b, rtol, atol):
+    """Return a mask of the values of two arrays of one shape that differ.
+
+    Numbers differ if they are not within the tolerances, other values if
+    they are not equal.
+    """
+
+    if a.dtype.kind in 'iuf' and b.dtype.kind in 'iuf':
+        return ~numpy.isclose(a, b, rtol, atol, equal_nan=True)
+    return numpy.asarray(a != b)
+
+def formatDifference(difference, rtol=1e-9, atol=0.0):
+    """Return a one line, human readable summary of a Difference.
+
+    The values of arrays and matrices counted as differing are those outside
+    the tolerances, which should be those given to diff.
+    """
+
+    location = '/'.join(p for p in (difference.path, difference.dictref) if p)
+    if difference.kind != 'changed':
+        return '%s %s' % (difference.kind, location)
+
+    (old, oldunits), (new, newunits) = difference.old, difference.new
+    if oldunits != newunits:
+        detail = 'units %s -> %s' % (oldunits, newunits)
+    elif numpy.ndim(old) == 0 and numpy.ndim(new) == 0:
+        detail = '%s -> %s' % (old, new)
+    elif numpy.shape(old) != numpy.shape(new):
+        detail = 'shape %s -> %s' % (numpy.shape(old), numpy.shape(new))
+    else:
+        old, new = numpy.asarray(old), numpy.asarray(new)
+        changed = numpy.count_nonzero(_differing(old, new, rtol, atol))
+        detail = '%d of %d values differ' % (changed, old.size)
+        if old.dtype.kind in 'iuf' and new.dtype.kind in 'iuf':
+            detail += ', max abs difference %g' % numpy.max(numpy.abs(old - new))
+    return 'changed %s: %s' % (location, detail)
+
+def main(argv=None):
+    """Command line interface, exits with status 1 if the documents differ."""
+
+    parser = argparse.ArgumentParser(
+        description='Compare two CML documents by module path and dictRef')
+    parser.add_argument('old', help='the reference CML document')
+    parser.add_argument('new', help='the CML document to compare with it')
+    parser.add_argument('--rtol', type=float, default=1e-9,
+                        help='relative tolerance for numeric values')
+    parser.add_argument('--atol', type=float, default=0.0,
+                        help='absolute tolerance for numeric values')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for difference in diff(args.old, args.new, args.rtol, args.atol):
+        print formatDifference(difference, args.rtol, args.atol)
+        status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
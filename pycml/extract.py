@@ -0,0 +1,190 @@
+# pyCML.extract: Fast extraction of selected elements from CML documents
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import mmap
+import re
+import xml.etree.ElementTree as ET
+
+# The text from the start of a tag up to one of its attributes, used to
+# check that a dictRef found by the scanner is an attribute and not text
+_INTAG = re.compile(r'<[^\s/>!?]+(?:\s+[^\s=]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*'
+                    r'\s+$')
+
+_XMLNS = re.compile(r'\s(xmlns(?::[^\s=]+)?)\s*=\s*("[^"]*"|\'[^\']*\')')
+
+def extract(source, dictrefs):
+    """Extract the elements with the given dictRefs from a CML document.
+
+    The bytes of the document are memory mapped and searched for dictRef
+    attributes with one of the values wanted. The XML parser is only given
+    the element holding each match, with its descendants, and everything in
+    between is skipped without being parsed. For a few dictRefs in a large
+    document this is much faster than even a streaming parse, which has to
+    build every element of the document.
+
+    The scanner relies on the document having no CDATA sections, comments,
+    DOCTYPE or entity declarations, processing instructions other than the
+    XML declaration or namespace declarations below the root element. If any
+    of these is present, if source is not a file that can be memory mapped,
+    or if any fragment fails to parse, the document is instead parsed as a
+    stream, so the elements yielded are always the same.
+
+    Elements nested within an element already extracted are not yielded
+    separately, they remain part of it.
+
+    :param :source A path or file object of a serialised CML document
+    :param :dictrefs The dictRef values of the elements to extract
+    :return: A generator of (dictRef, element) pairs in document order
+    """
+
+    dictrefs = set(dictrefs)
+    if not dictrefs:
+        return
+    data = _map(source)
+    if data is None:
+        elements = _parse(source, dictrefs)
+    else:
+        try:
+            # Fragments are parsed as the scan proceeds so that a failure can
+            # only be detected once some of the elements are found. These are
+            # held back until the whole document has been scanned.
+            elements = list(_scan(data, dictrefs))
+        except (ValueError, ET.ParseError):
+            elements = None
+        finally:
+            data.close()
+        if elements is None:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            elements = _parse(source, dictrefs)
+
+    for element in elements:
+        yield element
+
+def _map(source):
+    """Memory map a document, returning None if it can not be mapped."""
+
+    if isinstance(source, basestring):
+        f = open(source, 'rb')
+    elif hasattr(source, 'fileno'):
+        f = source
+    else:
+        return None
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError, AttributeError):
+        return None
+    finally:
+        if f is not source:
+            f.close()
+
+def _scan(data, dictrefs):
+    """Yield (dictRef, element) pairs found by scanning the bytes of data.
+
+    Raises ValueError if the document can not be scanned.
+    """
+
+    if any(re.search(r'[<>&"\']', ref) for ref in dictrefs):
+        raise ValueError, "dictRefs must not need escaping"
+
+    # The fragments are wrapped in an element declaring the namespaces of the
+    # root, after the XML declaration giving their encoding
+    if '\x00' in data[:4]:
+        raise ValueError, "Only byte oriented encodings are supported"
+    declaration = ''
+    start = 0
+    if data[:5] == '<?xml':
+        start = data.find('?>') + 2
+        declaration = data[:start]
+    # CDATA sections, comments, DOCTYPE and entity declarations all start
+    # with <! and processing instructions with <?
+    if data.find('<!', start) != -1 or data.find('<?', start) != -1:
+        raise ValueError, "Unsupported construct"
+    root = data.find('<', start)
+    rootend = data.find('>', root)
+    if root == -1 or rootend == -1:
+        raise ValueError, "No root element"
+    if data.find('xmlns', rootend) != -1:
+        raise ValueError, "Namespace declarations below the root"
+    namespaces = ''.join(' %s=%s' % m.groups()
+                         for m in _XMLNS.finditer(data[root:rootend]))
+    head = '%s<fragment%s>' % (declaration, namespaces)
+
+    pattern = re.compile(r'dictRef\s*=\s*(["\'])(%s)\1' %
+                         '|'.join(re.escape(ref) for ref in sorted(dictrefs)))
+    position = root
+    while True:
+        match = pattern.search(data, position)
+        if match is None:
+            return
+        start = data.rfind('<', 0, match.start())
+        if not _INTAG.match(data[start:match.start()]):
+            # Text that happens to look like the attribute
+            position = match.end()
+            continue
+
+        name = re.match(r'<([^\s/>]+)', data[start:match.start()]).group(1)
+        end = _elementEnd(data, start, name)
+        fragment = ET.fromstring(head + data[start:end] + '</fragment>')
+        yield match.group(2), fragment[0]
+        position = end
+
+def _elementEnd(data, start, name):
+    """Return the position after the end of the element starting at start."""
+
+    end = data.find('>', start) + 1
+    if data[end - 2] == '/':
+        return end
+
+    tags = re.compile(r'<(/?)%s[\s/>]' % re.escape(name))
+    depth = 1
+    position = end
+    while depth:
+        match = tags.search(data, position)
+        if match is None:
+            raise ValueError, "Element %s is not closed" % name
+        position = data.find('>', match.end() - 1) + 1
+        if match.group(1):
+            depth -= 1
+        elif data[position - 2] != '/':
+            depth += 1
+    return position
+
+def _parse(source, dictrefs):
+    """Yield (dictRef, element) pairs found by parsing a document as a stream.
+
+    As for pycml.pycml.iterparse elements are removed from their parents once
+    ended, except within the elements that are yielded.
+    """
+
+    stack = []
+    found = None
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if found is None and element.get('dictRef') in dictrefs:
+                found = element
+            stack.append(element)
+            continue
+
+        stack.pop()
+        if element is found:
+            yield element.get('dictRef'), element
+            found = None
+        if found is None and stack:
+            parent = stack[-1]
+            if parent[0] is element:
+                del parent[0]
+            else:
+                parent.remove(element)
@@ -0,0 +1,134 @@
+# pyCML.fingerprint: Canonical content hashes of CML documents
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import hashlib
+import xml.etree.ElementTree as ET
+
+import numpy
+
+from pycml.pycml import CMLDoc, PropParam, iterparse
+
+# Separators fed to the hash between the parts of the canonical form. These
+# can not occur in XML text so can not be confused with content.
+_START = '\x01'
+_END = '\x02'
+_FIELD = '\x03'
+
+def fingerprint(source, precision=10, algorithm='sha256'):
+    """Return a canonical content hash of a CML document.
+
+    The hash is computed over a canonical form of the document in which
+    attributes are taken in sorted order, text is split into whitespace
+    separated tokens and numbers are rounded to precision significant figures.
+    Two documents therefore have the same fingerprint if they differ only in
+    attribute order, whitespace, namespace prefixes or the formatting of their
+    numbers eg. 1.5 and 1.50000000001. The canonical form is fed to the hash
+    as the document is walked, or parsed as a stream, so no canonical copy of
+    the document is ever built.
+
+    Fingerprints can be used as the keys of a content addressed store to
+    avoid writing and storing the same results more than once.
+
+    :param :source A CMLDoc, an element, or a path or file object of a
+                   serialised CML document
+    :param :precision The number of significant figures numbers are compared to
+    :type :precision int
+    :param :algorithm The name of a hashlib algorithm
+    :type :algorithm str
+    :return: The hex digest of the canonical form
+    :rtype: str
+    """
+
+    digest = hashlib.new(algorithm)
+    numberformat = '%%.%dg' % precision
+    for event, element in _events(source):
+        if event == 'start':
+            digest.update(_START + element.tag)
+            for key, value in sorted(element.items()):
+                digest.update(_FIELD + key + '=' +
+                              _canonicalText(value, numberformat))
+        else:
+            digest.update(_FIELD + _canonicalContent(element, numberformat))
+            digest.update(_END)
+    return digest.hexdigest()
+
+def _events(source):
+    """Yield start and end events for the elements of a document.
+
+    Lazy values of parameters and properties are resolved at their start
+    event and, if release was requested, dropped again after their end event
+    as when the document is written, see CMLStreamWriter.
+    """
+
+    if isinstance(source, CMLDoc):
+        elements = source.getElements()
+        yield 'start', source._root
+    elif isinstance(source, ET.Element):
+        elements = [source]
+    else:
+        for event, element in iterparse(source):
+            yield event, element
+        return
+
+    for element in elements:
+        stack = [(element, False)]
+        while stack:
+            element, ended = stack.pop()
+            if ended:
+                yield 'end', element
+                if isinstance(element, PropParam):
+                    element.releaseValue()
+                continue
+            if isinstance(element, PropParam):
+                element.resolve()
+            yield 'start', element
+            stack.append((element, True))
+            stack.extend((child, False) for child in reversed(element))
+
+    if isinstance(source, CMLDoc):
+        yield 'end', source._root
+
+def _canonicalContent(element, numberformat):
+    """Return the canonical form of the text of an element.
+
+    Numeric arrays and matrices are normalised in a single vectorised step.
+    Their text is split on their delimiter, as by decodeValue.
+    """
+
+    values = getattr(element, 'values', None)
+    if values is None and element.get('dataType') in ('xsd:int', 'xsd:double')\
+                      and element.tag.rsplit('}', 1)[-1] in ('array', 'matrix'):
+        delimiter = element.get('delimiter', ' ')
+        values = numpy.fromstring(element.text or '',
+                                  sep=delimiter if delimiter.strip() else ' ')
+
+    if values is not None and values.dtype.kind in 'iuf':
+        values = values.ravel().astype(numpy.float64) + 0.0  # -0.0 becomes 0.0
+        return ' '.join(numpy.char.mod(numberformat, values).tolist())
+
+    return _canonicalText(element.text, numberformat)
+
+def _canonicalText(text, numberformat):
+    """Return whitespace separated tokens with numbers in a canonical format."""
+
+    if not text:
+        return ''
+    tokens = text.split()
+    for i, token in enumerate(tokens):
+        try:
+            tokens[i] = numberformat % (float(token) + 0.0)
+        except ValueError:
+            pass
+    return ' '.join(tokens)
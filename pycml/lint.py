@@ -0,0 +1,287 @@
+# pyCML.lint: Streaming checks of the arrays and matrices of CML documents
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import numpy
+
+from pycml.pycml import iterparse
+
+# A problem found in a document. path is the module path of the element, tag
+# its tag and dictref the dictRef of the parameter or property holding it.
+Problem = collections.namedtuple('Problem', 'path tag dictref message')
+
+# The attributes each element is required to have
+REQUIRED = {'parameter': ('dictRef',),
+            'property': ('dictRef',),
+            'scalar': ('dataType', 'units'),
+            'array': ('dataType', 'length', 'units'),
+            'matrix': ('dataType', 'rows', 'columns', 'units')}
+
+# The extension of the files found by lintFiles in directories
+EXTENSION = '.cml'
+
+# Lookup table of the bytes XML treats as whitespace
+_WHITESPACE = numpy.zeros(256, dtype=bool)
+_WHITESPACE[[ord(c) for c in ' \t\n\r']] = True
+
+def lint(source):
+    """Check the parameters, properties, arrays and matrices of a document.
+
+    The document is parsed as a stream, see pycml.pycml.iterparse, so only
+    one element is held in memory at a time. The checks are that:
+
+    - elements have the attributes listed in REQUIRED
+    - the number of items of an array matches its length attribute, and that
+      of a matrix its rows and columns attributes
+    - items separated by a delimiter other than whitespace are not empty and
+      the delimiter is used at all
+    - the items match the dataType of the element
+
+    The items of arrays and matrices are counted in a single vectorised step
+    over the bytes of their text. Values held in external payloads are not
+    read, only the presence of the payload file is checked.
+
+    :param :source A path or file object of a serialised CML document
+    :return: A generator of Problem tuples, including one for a document
+             that is not well formed
+    """
+
+    directory = os.path.dirname(source) if isinstance(source, basestring) \
+                                        else ''
+    path = []
+    modules = []
+    dictrefs = []
+    try:
+        for event, element in iterparse(source):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'module':
+                if event == 'start':
+                    dictref = element.get('dictRef')
+                    modules.append(dictref)
+                    if dictref:
+                        path.append(dictref.split(':')[-1])
+                elif modules.pop():
+                    path.pop()
+                continue
+
+            if tag in ('parameter', 'property'):
+                if event == 'start':
+                    dictrefs.append(element.get('dictRef'))
+                else:
+                    dictrefs.pop()
+            if event == 'end' and tag in REQUIRED:
+                location = ('/'.join(path), tag,
+                            dictrefs[-1] if dictrefs else None)
+                for message in _check(element, tag, directory):
+                    yield Problem(*(location + (message,)))
+    except ET.ParseError, e:
+        yield Problem('', None, None, 'not well formed: %s' % e)
+
+def _check(element, tag, directory):
+    """Yield messages for the problems of a single element."""
+
+    missing = [a for a in REQUIRED[tag] if element.get(a) is None]
+    if missing:
+        yield 'missing %s attribute%s' % (', '.join(missing),
+                                          's' if len(missing) > 1 else '')
+    datatype = element.get('dataType')
+    if tag == 'scalar' and datatype is not None:
+        message = _checkScalar(element.text or '', datatype)
+        if message:
+            yield message
+    if tag not in ('array', 'matrix'):
+        return
+
+    if element.get('payload') is not None:
+        if not os.path.exists(os.path.join(directory, element.get('payload'))):
+            yield 'payload %s not found' % element.get('payload')
+        return
+
+    text = element.text or ''
+    delimiter = element.get('delimiter', ' ')
+    count, empty = _countItems(text, delimiter)
+    if empty:
+        yield '%d empty item%s' % (empty, 's' if empty > 1 else '')
+    if delimiter.strip() and count == 1 and \
+       _countItems(text.strip(), ' ')[0] > 1:
+        yield 'delimiter %r is not used' % delimiter
+
+    try:
+        if tag == 'array':
+            expected = int(element.get('length', count))
+        else:
+            expected = int(element.get('rows', 1)) * \
+                       int(element.get('columns', count))
+    except ValueError:
+        yield 'invalid length, rows or columns'
+        return
+    if expected != count:
+        yield '%d items but %s %d' % (count, 'length' if tag == 'array'
+                                             else 'rows x columns', expected)
+
+    if empty:
+        return
+    if datatype in ('xsd:int', 'xsd:double'):
+        # Parsing stops at the first item that is not a number, and for ints
+        # at the decimal point or exponent of a float
+        dtype = int if datatype == 'xsd:int' else float
+        parsed = numpy.fromstring(text, dtype=dtype,
+                                  sep=delimiter if delimiter.strip() else ' ')
+        if parsed.size < count or \
+           (dtype is int and any(c in text for c in '.eE')):
+            yield 'items are not all %s' % datatype
+    elif datatype == 'xsd:boolean':
+        items = numpy.array(text.split(delimiter) if delimiter.strip()
+                            else text.split())
+        if not numpy.all(numpy.in1d(numpy.char.strip(items),
+                                    ['true', 'false', '1', '0'])):
+            yield 'items are not all xsd:boolean'
+    elif datatype not in ('xsd:str', 'xsd:string', None):
+        yield 'unknown dataType %s' % datatype
+
+def _checkScalar(text, datatype):
+    """Return a message if the text of a scalar does not match its dataType.
+
+    The checks are those made of the items of arrays, rather than whether
+    decodeValue succeeds, as it accepts any boolean and decodes unknown
+    dataTypes as strings.
+    """
+
+    item = text.strip()
+    try:
+        if datatype == 'xsd:int':
+            int(item)
+        elif datatype == 'xsd:double':
+            float(item)
+        elif datatype == 'xsd:boolean':
+            if item not in ('true', 'false', '1', '0'):
+                raise ValueError
+        elif datatype not in ('xsd:str', 'xsd:string'):
+            return 'unknown dataType %s' % datatype
+    except ValueError:
+        return 'value %r is not %s' % (text, datatype)
+
+def _countItems(text, delimiter):
+    """Return the number of items in a delimited text and how many are empty.
+
+    Whitespace delimited items are counted as the runs of non whitespace
+    bytes, other delimiters by their number of occurrences.
+    """
+
+    if not delimiter.strip():
+        data = numpy.frombuffer(text.encode('utf-8') if
+                                isinstance(text, unicode) else text,
+                                dtype=numpy.uint8)
+        if not data.size:
+            return 0, 0
+        space = _WHITESPACE[data]
+        starts = numpy.count_nonzero(space[:-1] & ~space[1:])
+        return starts + (not space[0]), 0
+
+    text = text.strip()
+    if not text:
+        return 0, 0
+    if len(delimiter) > 1:
+        items = text.split(delimiter)
+        return len(items), sum(1 for item in items if not item.strip())
+
+    data = numpy.frombuffer(text.encode('utf-8') if
+                            isinstance(text, unicode) else text,
+                            dtype=numpy.uint8)
+    mask = data == ord(delimiter)
+    positions = numpy.flatnonzero(mask)
+    if not positions.size:
+        return 1, 0
+    # An item is empty if it contains only whitespace, that is if no non
+    # whitespace byte lies between the delimiters on either side of it
+    content = numpy.cumsum(~_WHITESPACE[data] & ~mask)
+    bounds = numpy.concatenate(([0], content[positions], [content[-1]]))
+    return positions.size + 1, int(numpy.count_nonzero(numpy.diff(bounds) == 0))
+
+def lintFiles(paths, processes=None):
+    """Lint many documents in parallel using a pool of processes.
+
+    Directories are searched recursively for files with the extension
+    EXTENSION. Each document is linted as a stream in a single process, so
+    the memory used by each process does not depend on the size of the
+    documents.
+
+    :param :paths A list of paths of documents or directories
+    :param :processes The number of processes, by default one per CPU
+    :return: A generator of (path, problems) pairs, in no particular order,
+             for every document where problems is a list of Problem tuples
+    """
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_lintFile, _documents(paths), 16):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def _documents(paths):
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, subdirectories, names in os.walk(path):
+            subdirectories.sort()
+            for name in sorted(names):
+                if name.lower().endswith(EXTENSION):
+                    yield os.path.join(directory, name)
+
+def _lintFile(path):
+    try:
+        return path, list(lint(path))
+    except EnvironmentError, e:
+        return path, [Problem('', None, None, str(e))]
+
+def formatProblem(problem):
+    """Return a one line, human readable summary of a Problem."""
+
+    location = '/'.join(p for p in (problem.path, problem.dictref) if p)
+    if problem.tag:
+        location = '%s %s' % (location, problem.tag) if location \
+                                                    else problem.tag
+    return '%s: %s' % (location, problem.message) if location \
+                                                 else problem.message
+
+def main(argv=None):
+    """Command line interface, exits with status 1 if any problem was found."""
+
+    parser = argparse.ArgumentParser(
+        description='Check the arrays and matrices of CML documents')
+    parser.add_argument('inputs', nargs='+', metavar='input',
+                        help='CML documents, or directories of .cml files')
+    parser.add_argument('-j', '--processes', type=int,
+                        help='number of processes, by default one per CPU')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for path, problems in lintFiles(args.inputs, args.processes):
+        for problem in problems:
+            print '%s: %s' % (path, formatProblem(problem))
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
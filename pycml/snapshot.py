@@ -0,0 +1,179 @@
+# pyCML.snapshot: Binary snapshots of CML documents
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import cPickle
+import mmap
+import struct
+import xml.etree.ElementTree as ET
+
+import numpy
+
+from pycml.pycml import AbstractArray, CMLDoc, CMLError, PropParam, \
+                        SharedElement, sharedAttrib
+
+# A snapshot starts with a fixed header giving the format version and the
+# length of the pickled structure of the document. The raw buffers of the
+# arrays follow the structure, each aligned to _ALIGN bytes so that they can
+# be used in place once the file is memory mapped.
+_MAGIC = 'PYCMLSNP'
+_VERSION = 1
+_HEADER = struct.Struct('<8sHHQ')
+_ALIGN = 64
+
+def saveSnapshot(doc, fp):
+    """Write a binary snapshot of a CML document to a file like object.
+
+    A snapshot holds the structure of the document, that is the tags,
+    attributes and text of its elements, along with the values of its arrays
+    and matrices as raw NumPy buffers. No values are formatted as text so
+    writing and reading a snapshot is much faster than serialising the
+    document to XML and parsing it again, which makes snapshots suitable for
+    passing documents between the stages of a pipeline. A document loaded
+    from a snapshot serialises to exactly the same XML as the original.
+
+    Lazy parameter and property values are resolved as they are written and
+    released afterwards if requested, as for CMLDoc.serialise.
+
+    :param :doc The document to write, its getElements are written
+    :type :doc CMLDoc
+    :param :fp A file like object open for binary writing
+    :type :fp file object
+    :return: Returns the file object for immediate closure or manipulation
+    :rtype: file like object
+    """
+
+    nodes = []
+    buffers = []
+    offset = 0
+    for element in _walk(doc.getElements()):
+        values = getattr(element, 'values', None)
+        if values is None or values.dtype.hasobject:
+            nodes.append((element.tag, element.attrib, element.text,
+                          element.tail, len(element), None))
+            continue
+
+        values = numpy.ascontiguousarray(values)
+        offset = _aligned(offset)
+        nodes.append((element.tag, element.attrib, None, element.tail,
+                      len(element), (offset, values.dtype.str, values.shape)))
+        buffers.append((offset, values))
+        offset += values.nbytes
+
+    structure = cPickle.dumps((doc._root.tag, doc._root.attrib, nodes), 2)
+    fp.write(_HEADER.pack(_MAGIC, _VERSION, 0, len(structure)))
+    fp.write(structure)
+    position = _HEADER.size + len(structure)
+    start = _aligned(position)
+    fp.write('\0' * (start - position))
+
+    position = 0
+    for offset, values in buffers:
+        fp.write('\0' * (offset - position))
+        fp.write(buffer(values))
+        position = offset + values.nbytes
+    return fp
+
+def loadSnapshot(source):
+    """Load a CML document from a binary snapshot.
+
+    When source is a path the file is memory mapped and the arrays and
+    matrices of the document are views of the mapped buffers, so loading
+    does not read or copy their values. The values are read from the file
+    only as they are used, eg. when the document is serialised.
+
+    The document returned is a CMLDoc, whatever the class of the document the
+    snapshot was taken from, with its elements indexed as for appendElement.
+    Elements with identical attributes share them, see sharedAttrib, so
+    attributes should be changed with the set method of the elements.
+
+    :param :source The path of a snapshot or a file like object to read it from
+    :return: The document held in the snapshot
+    :rtype: CMLDoc
+    """
+
+    if isinstance(source, basestring):
+        f = open(source, 'rb')
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+    else:
+        data = source.read()
+
+    if len(data) < _HEADER.size:
+        raise CMLError, "Not a pycml snapshot"
+    magic, version, reserved, length = _HEADER.unpack(data[:_HEADER.size])
+    if magic != _MAGIC:
+        raise CMLError, "Not a pycml snapshot"
+    if version != _VERSION:
+        raise CMLError, "Unsupported snapshot version %d" % version
+
+    end = _HEADER.size + length
+    roottag, rootattrib, nodes = cPickle.loads(data[_HEADER.size:end])
+    start = _aligned(end)
+
+    doc = CMLDoc()
+    doc._root = ET.Element(roottag, rootattrib)
+    stack = []
+    for tag, attrib, text, tail, nchildren, buf in nodes:
+        attrib = sharedAttrib(attrib)
+        # The elements are given the shared attributes after they are
+        # created as ET.Element would copy them
+        if buf is None:
+            element = SharedElement(tag, attrib)
+            element.text = text
+        else:
+            offset, dtype, shape = buf
+            element = AbstractArray(tag)
+            element.attrib = attrib
+            element.values = _view(data, start + offset, numpy.dtype(dtype),
+                                   shape)
+        element.tail = tail
+
+        if stack:
+            parent, remaining = stack[-1]
+            parent.append(element)
+            if remaining == 1:
+                stack.pop()
+            else:
+                stack[-1] = (parent, remaining - 1)
+        else:
+            doc.cmlelements.append(element)
+        if nchildren:
+            stack.append((element, nchildren))
+
+    for element in doc.cmlelements:
+        doc.index.add(element)
+    return doc
+
+def _walk(elements):
+    """Yield the elements of a list of trees in document order."""
+
+    for element in elements:
+        lazy = [e.resolve() for e in element.iter()
+                            if isinstance(e, PropParam) and e.lazyvalue is not None]
+        for e in element.iter():
+            yield e
+        for e in lazy:
+            e.releaseValue()
+
+def _view(data, offset, dtype, shape):
+    count = int(numpy.prod(shape))
+    if not count:
+        return numpy.empty(shape, dtype)
+    return numpy.frombuffer(data, dtype, count, offset).reshape(shape)
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
@@ -0,0 +1,194 @@
+# pyCML.units: Conversion of values between units
+#
+# Public Domain Waiver:
+# To the extent possible under law, Cameron Neylon has waived all
+# copyright and related or neighboring rights to lablogpost.py
+# This work is published from United Kingdom.
+#
+# See http://creativecommons.org/publicdomain/zero/1.0/
+#
+# Dependencies: This library requires pycml along with all of its dependencies.
+#
+#################################
+
+from __future__ import absolute_import
+
+import os
+
+import numpy
+
+from pycml.pycml import CMLDataTypeError, CMLError, decodeValue, iterparse
+
+# Units known without loading a unit dictionary, as (multiplierToSI,
+# constantToSI, unitType). A value v in a unit is v * multiplierToSI +
+# constantToSI in the SI unit of its unitType.
+UNITS = {'si:none': (1.0, 0.0, 'unitType:none'),
+         'si:joule': (1.0, 0.0, 'unitType:energy'),
+         'si:m': (1.0, 0.0, 'unitType:length'),
+         'si:k': (1.0, 0.0, 'unitType:temperature'),
+         'si:s': (1.0, 0.0, 'unitType:time'),
+         'si:kg': (1.0, 0.0, 'unitType:mass'),
+         'si:c.m': (1.0, 0.0, 'unitType:dipole'),
+         'nonsi:hartree': (4.3597447222071e-18, 0.0, 'unitType:energy'),
+         'nonsi:electronvolt': (1.602176634e-19, 0.0, 'unitType:energy'),
+         'nonsi:kcal.mol-1': (6.947695457e-21, 0.0, 'unitType:energy'),
+         'nonsi:kj.mol-1': (1.660539067e-21, 0.0, 'unitType:energy'),
+         'nonsi:cm-1': (1.986445857e-23, 0.0, 'unitType:energy'),
+         'nonsi:bohr': (5.29177210903e-11, 0.0, 'unitType:length'),
+         'nonsi:angstrom': (1.0e-10, 0.0, 'unitType:length'),
+         'nonsi:celsius': (1.0, 273.15, 'unitType:temperature'),
+         'nonsi:femtosecond': (1.0e-15, 0.0, 'unitType:time'),
+         'nonsi:dalton': (1.66053906660e-27, 0.0, 'unitType:mass'),
+         'nonsi:debye': (3.33564095198e-30, 0.0, 'unitType:dipole')}
+
+class UnitConverter:
+    """Converts values between units using cached conversion tables.
+
+    Each units reference is resolved once to its multiplier and constant to
+    SI, from the unit definitions of a CMLDictionaries object or else from
+    UNITS. The scale and offset converting between each pair of units are
+    then computed once and cached, so that converting a decoded NumPy array
+    is a single vectorised multiply and add however many values or elements
+    are converted.
+
+    :param :dictionaries Unit dictionaries whose definitions are used in
+                         preference to UNITS
+    :type :dictionaries pycml.dictionary.CMLDictionaries
+    """
+
+    def __init__(self, dictionaries=None):
+        self.dictionaries = dictionaries
+        self._units = {}
+        self._factors = {}
+
+    def unit(self, ref):
+        """Return the (multiplierToSI, constantToSI, unitType) of a unit.
+
+        :rtype: tuple
+        """
+
+        try:
+            return self._units[ref]
+        except KeyError:
+            pass
+
+        if self.dictionaries is not None and self.dictionaries.hasUnit(ref):
+            attrib = self.dictionaries.unit(ref)
+            try:
+                unit = (float(attrib.get('multiplierToSI', 1)),
+                        float(attrib.get('constantToSI', 0)),
+                        attrib.get('unitType'))
+            except ValueError:
+                raise CMLError, "Invalid conversion to SI for unit %s" % ref
+        elif ref in UNITS:
+            unit = UNITS[ref]
+        else:
+            raise CMLError, "Unknown unit %s" % ref
+        self._units[ref] = unit
+        return unit
+
+    def factor(self, source, target):
+        """Return the (scale, offset) converting values from source to target.
+
+        A value v in source units is v * scale + offset in target units.
+
+        :param :source The units reference of the values eg. 'nonsi:hartree'
+        :param :target The units reference to convert to
+        :rtype: tuple
+        """
+
+        try:
+            return self._factors[source, target]
+        except KeyError:
+            pass
+
+        multiplier, constant, unittype = self.unit(source)
+        tmultiplier, tconstant, tunittype = self.unit(target)
+        if unittype != tunittype:
+            raise CMLError, "Can not convert %s of %s to %s of %s" % \
+                            (source, unittype, target, tunittype)
+        factor = (multiplier / tmultiplier, (constant - tconstant) / tmultiplier)
+        self._factors[source, target] = factor
+        return factor
+
+    def convert(self, value, source, target):
+        """Convert a number or NumPy array of values from source to target.
+
+        Arrays are converted in a single vectorised operation and a new array
+        of floats is returned. Values already in the target units are returned
+        unchanged, whatever their type.
+
+        :param :value A number, sequence of numbers or NumPy array
+        :param :source The units reference of the value
+        :param :target The units reference to convert to
+        """
+
+        if source == target:
+            return value
+        scale, offset = self.factor(source, target)
+        values = numpy.asarray(value)
+        if values.dtype.kind not in 'iuf':
+            raise CMLDataTypeError, "Values of type %s can not be converted" \
+                                    % values.dtype
+        values = values * scale
+        if offset:
+            values += offset
+        return values if values.ndim else float(values)
+
+    def convertElement(self, element, target, directory=''):
+        """Return the value of a CML element converted to target units.
+
+        :param :element A parameter, property, scalar, array or matrix
+        :type :element ET.Element
+        :param :target The units reference to convert to
+        :param :directory The directory of the document for external payloads
+        """
+
+        if element.tag.rsplit('}', 1)[-1] in ('parameter', 'property'):
+            units = None
+            for child in element:
+                units = child.get('units', units)
+        else:
+            units = element.get('units')
+        if units is None:
+            raise CMLError, "Element %s has no units" % element.get('dictRef')
+        return self.convert(decodeValue(element, directory), units, target)
+
+    def values(self, source, targets):
+        """Read the values of a document converted to a unit per dictRef.
+
+        The document is parsed as a stream and only parameters and properties
+        whose dictRef is in targets are decoded. Each is converted to the
+        units given for its dictRef, using the cached conversion factors, so
+        extracting values across many documents converts each array in one
+        vectorised step.
+
+        :param :source A path or file object of a serialised CML document
+        :param :targets The units reference to convert to keyed by dictRef
+                        eg. {'compchem:totalEnergy': 'nonsi:electronvolt'}
+        :type :targets dict
+        :return: A generator of (dictRef, value) pairs in document order
+        """
+
+        directory = os.path.dirname(source) if isinstance(source, basestring) \
+                                            else ''
+        subtrees = ('parameter', 'property')
+        for event, element in iterparse(source, subtrees):
+            if event != 'end' or element.tag.rsplit('}', 1)[-1] not in subtrees:
+                continue
+            dictref = element.get('dictRef')
+            if dictref in targets:
+                yield dictref, self.convertElement(element, targets[dictref],
+                                                   directory)
+
+# Converter for the units in UNITS, see convert
+_converter = UnitConverter()
+
+def convert(value, source, target):
+    """Convert a value between two of the units in UNITS.
+
+    See UnitConverter.convert, a UnitConverter should be used for units
+    defined in unit dictionaries.
+    """
+
+    return _converter.convert(value, source, target)
@@ -13,5 +13,13 @@ setup(name='pycml',
       install_requires = [
           'numpy'
           ],
+      entry_points = {
+          'console_scripts': [
+              'pycml = pycml.convert:main',
+              'pycml-diff = pycml.diff:main',
+              'pycml-logs = pycml.converters:main',
+              'pycml-lint = pycml.lint:main'
+              ]
+          },
       test_suite='test'
      )
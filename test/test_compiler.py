@@ -0,0 +1,125 @@
+import os
+import unittest
+import warnings
+from pycml.conventions.compiler import *
+from pycml.conventions.simple_comp_chem import *
+
+###
+#Testing of convention compilation
+####
+
+class TestCompileConvention(unittest.TestCase):
+
+    def setUp(self):
+        self.builders = compileConvention(convention)
+        self.params = [{'value': 1.5, 'attrib': {'dictRef': 'test:a',
+                                                 'units': 'test:b'}}]
+
+    def testBuilders(self):
+        self.assertEqual(self.builders.keys(),
+                         ['JobsList', 'Job', 'Environment', 'Initialisation',
+                          'Finalisation'])
+        self.assertTrue(compileConvention(convention) is self.builders)
+        self.assertTrue(issubclass(self.builders['Job'], CMLModule))
+        self.assertEqual(self.builders['Initialisation'].argnames,
+                         ('parameters', 'title'))
+
+    def build(self, classes):
+        jobslist = classes['JobsList']('jobs')
+        job = classes['Job']()
+        jobslist.append(job)
+        job.append(classes['Initialisation'](self.params, 'initial'))
+        job.append(classes['Finalisation'](self.params))
+        job.append(classes['Environment'](title='env').populate(self.params))
+        return ET.tostring(jobslist)
+
+    def testSameXML(self):
+        handwritten = {'JobsList': JobsList, 'Job': Job,
+                       'Initialisation': Initialisation,
+                       'Finalisation': Finalisation, 'Environment': Environment}
+        with warnings.catch_warnings(record=True) as expected:
+            warnings.simplefilter('always')
+            xml = self.build(handwritten)
+        with warnings.catch_warnings(record=True) as compiled:
+            warnings.simplefilter('always')
+            self.assertEqual(self.build(self.builders), xml)
+        self.assertEqual([str(w.message) for w in compiled],
+                         [str(w.message) for w in expected])
+        self.assertEqual(len(compiled), 2)
+
+    def testArguments(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            self.assertRaises(TypeError, self.builders['Job'], 'a', 'b')
+            self.assertRaises(TypeError, self.builders['Job'], name='a')
+            self.assertRaises(CMLError, self.builders['Job']().populate,
+                              self.params)
+
+    def testRequired(self):
+        spec = [{'attrib': {'dictRef': 'test:module', 'id': True},
+                 'class': CMLModule}]
+        builders = compileConvention(spec)
+        self.assertRaises(CMLError, builders['Module'])
+        self.assertEqual(builders['Module'](id='m1').attrib,
+                         {'dictRef': 'test:module', 'id': 'm1'})
+        self.assertRaises(CMLError, compileConvention,
+                          [{'attrib': {'dictRef': True}, 'class': CMLModule}])
+
+    def testGeneratedInit(self):
+        self.assertIsNot(self.builders['Job'].__init__.im_func,
+                         CompiledModule.__init__.im_func)
+        spec = [{'attrib': {'dictRef': 'test:module', 'xml:lang': False},
+                 'class': CMLModule}]
+        builder = compileConvention(spec)['Module']
+        self.assertIs(builder.__init__.im_func,
+                      CompiledModule.__init__.im_func)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(builder(**{'xml:lang': 'en'}).attrib,
+                             {'dictRef': 'test:module', 'xml:lang': 'en'})
+        self.assertEqual(len(caught), 0)
+
+    def testAttributeNames(self):
+        for name in ['attrib', 'init', 'self', 'index', '__pycml_attrib',
+                     'class', 'None']:
+            spec = [{'attrib': {'dictRef': 'test:module', name: True},
+                     'class': CMLModule}]
+            module = compileConvention(spec)['Module'](**{name: 'value'})
+            self.assertEqual(module.attrib,
+                             {'dictRef': 'test:module', name: 'value'})
+            self.assertEqual(ET.fromstring(ET.tostring(module)).attrib,
+                             module.attrib)
+
+    def testDuplicateNames(self):
+        spec = [{'attrib': {'dictRef': 'test:job'}, 'class': CMLModule,
+                 'children': [{'attrib': {'dictRef': 'other:job'},
+                               'class': CMLModule}]}]
+        self.assertRaises(CMLError, compileConvention, spec)
+
+    def testWarningLocation(self):
+        spec = [{'attrib': {'dictRef': 'test:module', 'xml:lang': False},
+                 'class': CMLModule}]
+        for builder in [self.builders['Job'],
+                        compileConvention(spec)['Module']]:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                builder()
+            self.assertEqual(len(caught), 1)
+            self.assertEqual(os.path.splitext(caught[0].filename)[0],
+                             os.path.splitext(__file__)[0])
+
+    def testSimpleCompChem(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem(env=True)
+        self.assertIsInstance(doc.job(), self.builders['Job'])
+        self.assertIsInstance(doc.job(), Job)
+        self.assertIsInstance(doc.environment(), self.builders['Environment'])
+        self.assertIsInstance(doc.initialisation(), Initialisation)
+        self.assertIsInstance(doc.initialisation(), CompChemModule)
+        doc.initialisation().populate(self.params)
+        self.assertEqual(doc.getValue('test:a', 'jobsList/job/initialisation'),
+                         1.5)
+
+if __name__ == '__main__':
+    unittest.main()
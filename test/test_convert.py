@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import warnings
+import xml.etree.ElementTree as ET
+from pycml.convert import *
+from pycml.pycml import *
+
+###
+#Testing of the command line converter
+####
+
+class TestConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.attrib = {'dictRef': 'compchem:method', 'units': 'si:none'}
+        self.energy = {'dictRef': 'compchem:totalEnergy',
+                       'units': 'nonsi:hartree'}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeInput(self, name, content):
+        path = os.path.join(self.directory, name)
+        open(path, 'wb').write(content)
+        return path
+
+    def run(self, *args, **kwargs):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            return unittest.TestCase.run(self, *args, **kwargs)
+
+    def testJSON(self):
+        path = self.writeInput('job.json', json.dumps(
+            {'initialisation': [{'value': 'b3lyp', 'attrib': self.attrib}],
+             'finalisation': [{'value': -76.4, 'attrib': self.energy},
+                              {'value': [[1, 0], [0, 1]],
+                               'attrib': self.energy}]}))
+        output = convert(path, os.path.join(self.directory, 'job.cml'))
+        root = ET.parse(output).getroot()
+        job = root.find('module').find('module')
+        initialisation, finalisation = job
+        self.assertEqual(initialisation.find('parameterList/parameter/scalar')
+                         .text, 'b3lyp')
+        properties = finalisation.findall('propertyList/property')
+        self.assertEqual(properties[0][0].text, '-76.4')
+        self.assertEqual(properties[1][0].tag, 'matrix')
+
+    def testNoTitleWarnings(self):
+        path = self.writeInput('job.json', json.dumps(
+            {'environment': [{'value': 'linux', 'attrib': self.attrib}]}))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            convert(path, os.path.join(self.directory, 'job.cml'))
+        self.assertEqual([w for w in caught if 'title' in str(w.message)], [])
+
+    def testJSONList(self):
+        path = self.writeInput('job.json', json.dumps(
+            [{'value': 'b3lyp', 'attrib': self.attrib}]))
+        self.assertEqual(readParameters(path, 'initialisation').keys(),
+                         ['initialisation'])
+        path = self.writeInput('bad.json', json.dumps({'final': []}))
+        self.assertRaises(CMLError, readParameters, path)
+
+    def testCSV(self):
+        path = self.writeInput('job.csv',
+            'module,dictRef,units,value\n'
+            'initialisation,compchem:method,si:none,b3lyp\n'
+            ',compchem:totalEnergy,nonsi:hartree,-76.4\n'
+            ',compchem:charge,si:none,0\n'
+            ',compchem:converged,si:none,true\n'
+            ',compchem:grid,si:none,0 0.5 1\n')
+        modules = readParameters(path)
+        self.assertEqual([p['value'] for p in modules['finalisation']],
+                         [-76.4, 0, True, [0, 0.5, 1]])
+        self.assertEqual(modules['initialisation'][0]['value'], 'b3lyp')
+        path = self.writeInput('bad.csv', 'dictRef,value\ncompchem:x,1\n')
+        self.assertRaises(CMLError, readParameters, path)
+
+    def testMain(self):
+        inputs = [self.writeInput('a.json',
+                      json.dumps([{'value': 1, 'attrib': self.attrib}])),
+                  self.writeInput('b.csv',
+                      'dictRef,units,value\ncompchem:method,si:none,hf\n'),
+                  self.writeInput('c.json', '{')]
+        output = os.path.join(self.directory, 'out')
+        os.mkdir(output)
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+        try:
+            self.assertEqual(main(inputs[:2] + ['-o', output]), 0)
+            self.assertEqual(main(inputs), 1)
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(sorted(os.listdir(output)), ['a.cml', 'b.cml'])
+
+    def testNumpyNotImported(self):
+        script = ('import sys, StringIO\n'
+                  'from pycml.pycml import *\n'
+                  'doc = CMLDoc()\n'
+                  'doc.appendElement(PropertyList([{"value": 1.5, "attrib":'
+                  ' {"dictRef": "a:b", "units": "a:c"}}]))\n'
+                  'doc.serialise(StringIO.StringIO())\n'
+                  'print "numpy" in sys.modules\n')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.Popen([sys.executable, '-c', script], cwd=root,
+                                   stdout=subprocess.PIPE)
+        self.assertEqual(process.communicate()[0].strip(), 'False')
+
+if __name__ == '__main__':
+    unittest.main()
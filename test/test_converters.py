@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import xml.etree.ElementTree as ET
+from pycml.converters import *
+from pycml.converters.base import LogParser, rule
+from pycml.pycml import *
+
+LOGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'logs')
+
+###
+#Testing of conversion of program output
+####
+
+class TestParsers(unittest.TestCase):
+
+    def parse(self, name):
+        path = os.path.join(LOGS, name)
+        parser = detectParser(open(path).readlines()[:DETECT_LINES])()
+        for line in open(path):
+            parser.feed(line)
+        return parser
+
+    def checkWater(self, parser, method, basis):
+        self.assertEqual(parser.parameters['compchem:method'][0], method)
+        self.assertEqual(parser.parameters['compchem:basis'][0], basis)
+        self.assertEqual(parser.parameters['compchem:charge'][0], 0)
+        self.assertEqual(parser.parameters['compchem:multiplicity'][0], 1)
+        self.assertEqual(parser.elements, ['O', 'H', 'H'])
+        self.assertEqual(parser.coords[1], [0.0, 0.763239, -0.477047])
+        self.assertEqual(parser.properties['compchem:zpe'],
+                         (0.021093, 'nonsi:hartree'))
+        orbitals = parser.properties['compchem:orbitalEnergies'][0]
+        self.assertEqual(orbitals[:2], [-19.13825, -0.99826])
+        charges = parser.properties['compchem:mullikenCharges'][0]
+        self.assertAlmostEqual(sum(charges), 0.0, 2)
+
+    def testGaussian(self):
+        parser = self.parse('water_gaussian.log')
+        self.assertEqual(parser.program, 'gaussian')
+        self.checkWater(parser, 'B3LYP', '6-31G(d)')
+        self.assertEqual(parser.properties['compchem:totalEnergy'][0],
+                         -76.4089533)
+        self.assertEqual(len(parser.properties['compchem:orbitalEnergies'][0]),
+                         10)
+        self.assertEqual(parser.properties['compchem:dipoleMoment'][0],
+                         [0.0, 0.0, -2.0934])
+
+    def testOrca(self):
+        parser = self.parse('water_orca.out')
+        self.assertEqual(parser.program, 'orca')
+        self.checkWater(parser, 'B3LYP', 'def2-SVP')
+        self.assertEqual(parser.properties['compchem:totalEnergy'][0],
+                         -76.321247103)
+        self.assertAlmostEqual(
+            parser.properties['compchem:dipoleMoment'][0][2], -2.0934, 3)
+
+    def testNWChem(self):
+        parser = self.parse('water_nwchem.out')
+        self.assertEqual(parser.program, 'nwchem')
+        self.checkWater(parser, 'B3LYP', '6-31G*')
+        self.assertEqual(parser.properties['compchem:totalEnergy'][0],
+                         -76.408953303326)
+        self.assertEqual(parser.properties['compchem:mullikenCharges'][0],
+                         [-0.84, 0.42, 0.42])
+
+    def testRegisterParser(self):
+        class EchoParser(LogParser):
+            program = 'echo'
+            signature = 'ECHO'
+            rules = (rule('energy', r'energy (\S+)', 'readEnergy'),)
+
+            def readEnergy(self, match):
+                self.setProperty('totalEnergy', float(match.group(1)))
+
+        registerParser(EchoParser)
+        self.assertTrue(getParser('echo') is EchoParser)
+        self.assertTrue(detectParser(['ECHO 1.0\n']) is EchoParser)
+        self.assertRaises(CMLError, getParser, 'unknown')
+
+class TestConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in os.listdir(LOGS):
+            shutil.copy(os.path.join(LOGS, name), self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run(self, *args, **kwargs):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            return unittest.TestCase.run(self, *args, **kwargs)
+
+    def testConvertLog(self):
+        path = os.path.join(self.directory, 'water_orca.out')
+        output = convertLog(path)
+        self.assertEqual(output, os.path.join(self.directory, 'water_orca.cml'))
+        finalisation = ET.parse(output).getroot()[0][0][1]
+        properties = finalisation.findall('propertyList/property')
+        self.assertEqual(properties[0].get('dictRef'), 'compchem:scfEnergy')
+        self.assertEqual(finalisation.find('molecule/atomArray')
+                         .get('elementType'), 'O H H')
+
+    def testUnrecognised(self):
+        path = os.path.join(self.directory, 'unknown.log')
+        open(path, 'w').write('nothing to see\n')
+        self.assertRaises(CMLError, convertLog, path)
+        convertLog(path, program='orca')
+
+    def testConvertDirectory(self):
+        open(os.path.join(self.directory, 'unknown.log'), 'w').write('\n')
+        results = convertDirectory(self.directory, processes=2)
+        self.assertEqual([os.path.basename(path) for path, output, error
+                                                 in results],
+                         ['unknown.log', 'water_gaussian.log',
+                          'water_nwchem.out', 'water_orca.out'])
+        self.assertTrue(results[0][1] is None)
+        self.assertTrue(results[0][2].startswith('Unrecognised'))
+        for path, output, error in results[1:]:
+            self.assertTrue(os.path.exists(output))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+import warnings
+from pycml.dictionary import *
+from pycml.pycml import *
+from pycml.conventions.simple_comp_chem import SimpleCompChem
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+###
+#Testing of CML dictionary loading and validation
+####
+
+class TestDictionaries(unittest.TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.paths = [os.path.join(DATA, name) for name in
+                      ['compchem_dictionary.xml', 'nonsi_units.xml']]
+        self.test = CMLDictionaries(self.paths, self.cachedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def testLoad(self):
+        self.assertEqual(self.test.prefixes, set(['compchem', 'nonsi']))
+        self.assertTrue(self.test.hasEntry('compchem:totalEnergy'))
+        self.assertFalse(self.test.hasEntry('compchem:totalEnergi'))
+        self.assertTrue(self.test.hasUnit('nonsi:hartree'))
+        self.assertEqual(self.test.unit('nonsi:hartree')['multiplierToSI'],
+                         '4.3597447222071E-18')
+        self.assertRaises(CMLError, self.test.unit, 'nonsi:parsec')
+
+    def testCache(self):
+        self.assertEqual(len(os.listdir(self.cachedir)), 2)
+        cached = CMLDictionaries(self.paths, self.cachedir)
+        self.assertEqual(cached.entries, self.test.entries)
+        self.assertEqual(cached.units, self.test.units)
+
+    def testNoCache(self):
+        uncached = CMLDictionaries(self.paths, False)
+        self.assertEqual(uncached.entries, self.test.entries)
+        home = os.environ.get('HOME')
+        os.environ['HOME'] = tempfile.mkdtemp()
+        try:
+            uncached = CMLDictionaries(self.paths)
+            self.assertEqual(uncached.units, self.test.units)
+            self.assertEqual(os.listdir(os.environ['HOME']), [])
+        finally:
+            shutil.rmtree(os.environ['HOME'])
+            if home is None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = home
+
+    def testNotADictionary(self):
+        path = os.path.join(self.cachedir, 'notadictionary.xml')
+        open(path, 'w').write('<cml><scalar>1</scalar></cml>')
+        self.assertRaises(CMLError, self.test.load, path)
+
+    def buildDocument(self):
+        doc = CMLDoc()
+        plist = [{'value': 1.5, 'attrib': {'dictRef': 'compchem:totalEnergy',
+                                           'units': 'nonsi:hartree'}},
+                 {'value': 1.5, 'attrib': {'dictRef': 'compchem:totalEnergi',
+                                           'units': 'nonsi:hartre'}},
+                 {'value': 1, 'attrib': {'dictRef': 'other:thing',
+                                         'units': 'si:none'}}]
+        doc.appendElement(PropertyList(plist))
+        return doc
+
+    def testValidate(self):
+        doc = self.buildDocument()
+        out = StringIO.StringIO()
+        doc.serialise(out)
+        out.seek(0)
+        for source in [doc, doc.cmlelements[0], out]:
+            problems = self.test.validate(source)
+            self.assertEqual([(p.tag, p.attribute, p.value) for p in problems],
+                             [('property', 'dictRef', 'compchem:totalEnergi'),
+                              ('scalar', 'units', 'nonsi:hartre')])
+
+    def testStrict(self):
+        problems = self.test.validate(self.buildDocument(), strict=True)
+        self.assertEqual(len(problems), 4)
+        self.assertEqual(problems[2].value, 'other:thing')
+
+    def testUnwrittenSimpleCompChem(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem()
+        doc.finalisation().populate([{'value': 1.5, 'attrib': {
+            'dictRef': 'compchem:totalEnergi', 'units': 'nonsi:hartree'}}])
+        problems = self.test.validate(doc)
+        self.assertEqual([p.value for p in problems], ['compchem:totalEnergi'])
+
+if __name__ == '__main__':
+    unittest.main()
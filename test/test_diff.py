@@ -0,0 +1,130 @@
+import os
+import StringIO
+import sys
+import tempfile
+import unittest
+import numpy
+from pycml.diff import *
+from pycml.pycml import *
+
+###
+#Testing of streaming comparison of CML documents
+####
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.attrib = {'dictRef': 'test:dictRef', 'units': 'test:units'}
+
+    def serialise(self, values, extra=None, units='test:units', order=None):
+        doc = CMLDoc()
+        module = CMLModule({'dictRef': 'test:module'})
+        plist = [{'value': value, 'attrib': {'dictRef': 'test:%s' % name,
+                                              'units': units}}
+                 for name, value in sorted(values.items())]
+        if order:
+            plist.reverse()
+        module.append(PropertyList(plist))
+        if extra:
+            module.append(CMLModule({'dictRef': 'test:%s' % extra}))
+        doc.appendElement(module)
+        out = StringIO.StringIO()
+        doc.serialise(out)
+        out.seek(0)
+        return out
+
+    def values(self, **changes):
+        values = {'energy': -76.4, 'grid': numpy.linspace(0, 1, 1000),
+                  'matrix': numpy.eye(3), 'method': 'b3lyp'}
+        values.update(changes)
+        return values
+
+    def testIdentical(self):
+        self.assertEqual(list(diff(self.serialise(self.values()),
+                                   self.serialise(self.values(), order=True))),
+                         [])
+
+    def testTolerance(self):
+        grid = numpy.linspace(0, 1, 1000) * (1 + 1e-12)
+        self.assertEqual(list(diff(self.serialise(self.values()),
+                                   self.serialise(self.values(grid=grid)))),
+                         [])
+        grid = numpy.linspace(0, 1, 1000)
+        grid[10] += 1e-3
+        differences = list(diff(self.serialise(self.values()),
+                                self.serialise(self.values(grid=grid))))
+        self.assertEqual([(d.kind, d.path, d.dictref) for d in differences],
+                         [('changed', 'module', 'test:grid')])
+        self.assertEqual(formatDifference(differences[0]),
+                         'changed module/test:grid: 1 of 1000 values differ, '
+                         'max abs difference 0.001')
+        self.assertEqual(list(diff(self.serialise(self.values()),
+                                   self.serialise(self.values(grid=grid)),
+                                   atol=1e-2)), [])
+
+        # Values within the tolerance are not counted as differing
+        grid = numpy.linspace(0, 1, 1000) * (1 + 1e-12)
+        grid[10] += 1e-3
+        differences = list(diff(self.serialise(self.values()),
+                                self.serialise(self.values(grid=grid))))
+        self.assertTrue(formatDifference(differences[0]).startswith(
+                        'changed module/test:grid: 1 of 1000 values differ'))
+        self.assertTrue(formatDifference(differences[0], rtol=0).startswith(
+                        'changed module/test:grid: 999 of 1000 values differ'))
+
+    def testChanged(self):
+        differences = list(diff(self.serialise(self.values()),
+                                self.serialise(self.values(energy=-76.5,
+                                                           method='hf'))))
+        self.assertEqual([formatDifference(d) for d in differences],
+                         ['changed module/test:energy: -76.4 -> -76.5',
+                          'changed module/test:method: b3lyp -> hf'])
+        differences = list(diff(self.serialise(self.values()),
+                                self.serialise(self.values(), units='other')))
+        self.assertEqual(len(differences), 4)
+
+    def testNamespaced(self):
+        sources = []
+        for values in [self.values(), self.values(energy=-76.5)]:
+            text = self.serialise(values).getvalue() \
+                       .replace('<cml:cml xmlns:cml=', '<cml xmlns=') \
+                       .replace('</cml:cml>', '</cml>')
+            self.assertIn('<cml xmlns=', text)
+            sources.append(StringIO.StringIO(text))
+        differences = list(diff(*sources))
+        self.assertEqual([formatDifference(d) for d in differences],
+                         ['changed module/test:energy: -76.4 -> -76.5'])
+
+    def testAddedRemoved(self):
+        old = self.values()
+        new = self.values(zpe=0.02)
+        del new['method']
+        differences = list(diff(self.serialise(old, extra='old'),
+                                self.serialise(new, extra='new')))
+        self.assertEqual([formatDifference(d) for d in differences],
+                         ['removed module/test:method',
+                          'removed module/test:old',
+                          'added module/test:new',
+                          'added module/test:zpe'])
+
+    def testMain(self):
+        paths = []
+        for values in [self.values(), self.values(energy=-76.5)]:
+            handle, path = tempfile.mkstemp(suffix='.cml')
+            os.write(handle, self.serialise(values).getvalue())
+            os.close(handle)
+            paths.append(path)
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            self.assertEqual(main(paths), 1)
+            self.assertEqual(main(paths + ['--atol', '0.5']), 0)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            for path in paths:
+                os.remove(path)
+        self.assertEqual(output, 'changed module/test:energy: -76.4 -> -76.5\n')
+
+if __name__ == '__main__':
+    unittest.main()
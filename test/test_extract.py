@@ -0,0 +1,85 @@
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+import numpy
+from pycml.extract import *
+from pycml.extract import _map, _scan
+from pycml.pycml import *
+
+###
+#Testing of extraction of selected elements
+####
+
+class TestExtract(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.cml')
+        doc = CMLDoc()
+        outer = CMLModule({'dictRef': 'test:outer'})
+        inner = CMLModule({'dictRef': 'test:inner'})
+        inner.append(PropertyList([
+            {'value': 'dictRef="test:energy"',
+             'attrib': {'dictRef': 'test:note', 'units': 'si:none'}},
+            {'value': -76.4, 'attrib': {'dictRef': 'test:energy',
+                                        'units': 'nonsi:hartree'}},
+            {'value': numpy.linspace(0, 1, 100),
+             'attrib': {'dictRef': 'test:grid', 'units': 'si:none'}}]))
+        outer.append(inner)
+        outer.append(ParameterList([
+            {'value': 'b3lyp', 'attrib': {'dictRef': 'test:method',
+                                          'units': 'si:none'}}]))
+        doc.appendElement(outer)
+        f = open(self.path, 'wb')
+        doc.serialise(f)
+        f.close()
+        self.content = open(self.path, 'rb').read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def extracted(self, source, dictrefs):
+        return [(dictref, ET.tostring(element))
+                for dictref, element in extract(source, dictrefs)]
+
+    def testExtract(self):
+        dictrefs = ['test:grid', 'test:energy', 'test:method']
+        data = _map(self.path)
+        scanned = [(d, ET.tostring(e)) for d, e in _scan(data, set(dictrefs))]
+        data.close()
+        self.assertEqual([dictref for dictref, element in scanned],
+                         ['test:energy', 'test:grid', 'test:method'])
+        self.assertEqual(self.extracted(self.path, dictrefs), scanned)
+        # A file object without a file number is parsed
+        self.assertEqual(self.extracted(StringIO.StringIO(self.content),
+                                        dictrefs), scanned)
+
+        dictref, grid = list(extract(open(self.path, 'rb'), ['test:grid']))[0]
+        self.assertTrue(numpy.allclose(decodeValue(grid),
+                                       numpy.linspace(0, 1, 100)))
+        self.assertEqual(list(extract(self.path, [])), [])
+
+    def testNested(self):
+        extracted = self.extracted(self.path, ['test:inner', 'test:energy'])
+        self.assertEqual([dictref for dictref, element in extracted],
+                         ['test:inner'])
+        self.assertTrue('test:energy' in extracted[0][1])
+
+    def testFallback(self):
+        expected = self.extracted(self.path, ['test:energy', 'test:inner'])
+        content = self.content.replace('<propertyList',
+                                       '<!-- dictRef="test:energy" -->'
+                                       '<propertyList', 1)
+        open(self.path, 'wb').write(content)
+        data = _map(self.path)
+        self.assertRaises(ValueError, list,
+                          _scan(data, set(['test:energy'])))
+        data.close()
+        self.assertEqual(self.extracted(self.path,
+                                        ['test:energy', 'test:inner']),
+                         expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import StringIO
+import unittest
+import warnings
+import numpy
+from pycml.fingerprint import *
+from pycml.pycml import *
+from pycml.conventions.simple_comp_chem import SimpleCompChem
+
+###
+#Testing of canonical fingerprints
+####
+
+class TestFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.attrib = {'dictRef': 'test:dictRef', 'units': 'test:units'}
+        self.doc = self.buildDocument([1.5, 2.25, -0.0], 42)
+
+    def buildDocument(self, values, count):
+        doc = CMLDoc()
+        module = CMLModule({'dictRef': 'test:module', 'title': 'test'})
+        module.append(PropertyList([
+                          {'value': numpy.array(values), 'attrib': self.attrib},
+                          {'value': count, 'attrib': self.attrib},
+                          {'value': 'text', 'attrib': self.attrib}]))
+        doc.appendElement(module)
+        return doc
+
+    def serialise(self, doc):
+        out = StringIO.StringIO()
+        doc.serialise(out)
+        out.seek(0)
+        return out
+
+    def testStreamMatchesTree(self):
+        expected = fingerprint(self.doc)
+        self.assertEqual(fingerprint(self.serialise(self.doc)), expected)
+        self.assertEqual(len(expected), 64)
+
+    def testFormattingIgnored(self):
+        text = self.serialise(self.doc).getvalue()
+        reformatted = text.replace('2.25', '2.2500000000001')\
+                          .replace('-0.0', '0')\
+                          .replace('<module dictRef="test:module" title="test">',
+                                   '<module  title="test"\n dictRef="test:module">')\
+                          .replace('>text<', '>  text\n<')
+        self.assertNotEqual(reformatted, text)
+        self.assertEqual(fingerprint(StringIO.StringIO(reformatted)),
+                         fingerprint(self.doc))
+
+    def testContentDiffers(self):
+        for doc in [self.buildDocument([1.5, 2.26, 0.0], 42),
+                    self.buildDocument([1.5, 2.25, 0.0], 43)]:
+            self.assertNotEqual(fingerprint(doc), fingerprint(self.doc))
+        # Differences beyond the precision are ignored
+        doc = self.buildDocument([1.5, 2.2500001, 0.0], 42)
+        self.assertNotEqual(fingerprint(doc), fingerprint(self.doc))
+        self.assertEqual(fingerprint(doc, precision=5),
+                         fingerprint(self.doc, precision=5))
+
+    def testElement(self):
+        element = self.doc.cmlelements[0]
+        self.assertEqual(fingerprint(element),
+                         fingerprint(ET.fromstring(ET.tostring(element))))
+
+    def testDelimiter(self):
+        array = Array(numpy.array([1.5, 2.25, 3.0]), {'units': 'test:units'})
+        array.delimiter = ','
+        array.set('delimiter', ',')
+        parsed = ET.fromstring(ET.tostring(array))
+        self.assertEqual(parsed.text, '1.5,2.25,3.0')
+        self.assertEqual(fingerprint(parsed), fingerprint(array))
+
+    def testReleased(self):
+        calls = []
+        def value():
+            calls.append(True)
+            return numpy.ones(3)
+        self.doc.cmlelements[0][0].append(Property(value, self.attrib,
+                                                   release=True))
+        expected = fingerprint(self.doc)
+        self.assertEqual(len(self.doc.cmlelements[0][0][-1]), 0)
+        self.assertEqual(fingerprint(self.doc), expected)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(fingerprint(self.serialise(self.doc)), expected)
+
+    def testUnwrittenSimpleCompChem(self):
+        fingerprints = []
+        for value in [1.5, 2.5]:
+            with warnings.catch_warnings(record=True):
+                warnings.simplefilter('always')
+                doc = SimpleCompChem()
+            doc.finalisation().populate([{'value': value,
+                                          'attrib': self.attrib}])
+            fingerprints.append(fingerprint(doc))
+            self.assertEqual(fingerprint(self.serialise(doc)), fingerprints[-1])
+        self.assertNotEqual(fingerprints[0], fingerprints[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+import numpy
+from pycml.lint import *
+from pycml.pycml import *
+
+###
+#Testing of streaming checks of CML documents
+####
+
+BROKEN = """<cml xmlns="http://www.xml-cml.org/schema">
+<module dictRef="test:module">
+<propertyList>
+<property dictRef="test:short"><array dataType="xsd:double" delimiter=" " length="4" units="test:units">1.0 2.0
+ 3.0</array></property>
+<property dictRef="test:type"><array dataType="xsd:int" delimiter=" " length="2" units="test:units">1 2.5</array></property>
+<property dictRef="test:empty"><array dataType="xsd:double" delimiter="," length="4" units="test:units">1.0,,2.0, </array></property>
+<property dictRef="test:unused"><array dataType="xsd:double" delimiter="," length="1" units="test:units">1.0 2.0</array></property>
+<property dictRef="test:matrix"><matrix columns="2" dataType="xsd:double" delimiter=" " rows="2" units="test:units">1 2 3</matrix></property>
+<property dictRef="test:scalar"><scalar dataType="xsd:int">x</scalar></property>
+<property dictRef="test:flag"><scalar dataType="xsd:boolean" units="test:units">maybe</scalar></property>
+<property dictRef="test:unknown"><scalar dataType="xsd:frob" units="test:units">1</scalar></property>
+<property><array dataType="xsd:boolean" length="2" units="test:units">true maybe</array></property>
+</propertyList>
+</module>
+</cml>"""
+
+class TestLint(unittest.TestCase):
+
+    def serialise(self):
+        doc = CMLDoc()
+        module = CMLModule({'dictRef': 'test:module'})
+        plist = [{'value': value, 'attrib': {'dictRef': 'test:%s' % name,
+                                              'units': 'test:units'}}
+                 for name, value in [('energy', -76.4), ('method', 'b3lyp'),
+                                     ('grid', numpy.linspace(0, 1, 1000)),
+                                     ('flags', [True, False]),
+                                     ('matrix', numpy.eye(3))]]
+        module.append(PropertyList(plist))
+        doc.appendElement(module)
+        out = StringIO.StringIO()
+        doc.serialise(out)
+        out.seek(0)
+        return out
+
+    def testValid(self):
+        self.assertEqual(list(lint(self.serialise())), [])
+
+    def testProblems(self):
+        problems = list(lint(StringIO.StringIO(BROKEN)))
+        self.assertEqual([formatProblem(p) for p in problems],
+            ['module/test:short array: 3 items but length 4',
+             'module/test:type array: items are not all xsd:int',
+             'module/test:empty array: 2 empty items',
+             'module/test:unused array: delimiter \',\' is not used',
+             'module/test:matrix matrix: 3 items but rows x columns 4',
+             'module/test:scalar scalar: missing units attribute',
+             "module/test:scalar scalar: value 'x' is not xsd:int",
+             "module/test:flag scalar: value 'maybe' is not xsd:boolean",
+             'module/test:unknown scalar: unknown dataType xsd:frob',
+             'module array: items are not all xsd:boolean',
+             'module property: missing dictRef attribute'])
+
+    def testNotWellFormed(self):
+        problems = list(lint(StringIO.StringIO(BROKEN[:200])))
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].message.startswith('not well formed'))
+
+    def testLintFiles(self):
+        directory = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(directory, 'sub'))
+            for name, content in [('good.cml', self.serialise().getvalue()),
+                                  ('sub/bad.cml', BROKEN),
+                                  ('notes.txt', 'not cml')]:
+                f = open(os.path.join(directory, name), 'wb')
+                f.write(content)
+                f.close()
+            results = dict(lintFiles([directory], processes=2))
+            self.assertEqual(sorted(results),
+                             [os.path.join(directory, 'good.cml'),
+                              os.path.join(directory, 'sub', 'bad.cml')])
+            self.assertEqual(results[os.path.join(directory, 'good.cml')], [])
+            self.assertEqual(
+                len(results[os.path.join(directory, 'sub', 'bad.cml')]), 11)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,10 @@
+import os
+import shutil
+import StringIO
+import cPickle
+import tempfile
 import unittest
+import numpy
 from pycml.pycml import *
 
 ###
@@ -87,7 +93,97 @@ class TestArrayGeneration(BaseArrayTest):
         self.assertEqual(self.test.attrib['dataType'], "xsd:double")
 
     def testMixedList(self):
-        self.assertRaises(NotImplementedError, Array, self.mixedlist, self.attrib)
+        self.test = Array(self.mixedlist, self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:str")
+        self.assertEqual(self.test.text, "1 2 3 4 gtr")
+        self.test = Array([1, 2.5, 3], self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:double")
+        self.assertEqual(self.test.text, "1.0 2.5 3.0")
+        self.test = Array([True, 2], self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:int")
+
+    def testNumpyScalarList(self):
+        self.test = Array([numpy.int32(1), numpy.int64(2)], self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:int")
+        self.assertEqual(self.test.text, "1 2")
+        self.test = Array([numpy.float32(0.5), 1], self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:double")
+        self.test = Array([True, numpy.bool_(False)], self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:boolean")
+        self.assertEqual(self.test.text, "true false")
+
+    def testUnsupportedList(self):
+        self.assertRaises(CMLDataTypeError, Array, [1, None], self.attrib)
+        self.assertRaises(CMLError, Array, [[1, 2], [3, 4]], self.attrib)
+
+class TestNumpyArrayGeneration(BaseArrayTest):
+
+    def testArray(self):
+        self.test = Array(numpy.array(self.floatlist), self.attrib)
+        self.xml = ET.fromstring(self.stringinfloat)
+        self.assertEqual(ET.tostring(self.test), ET.tostring(self.xml))
+        self.test = Array(numpy.array(self.intlist), self.attrib)
+        self.assertEqual(self.test.attrib['dataType'], "xsd:int")
+        self.assertRaises(CMLError, Array, numpy.ones((2, 2)), self.attrib)
+
+    def testMatrix(self):
+        self.test = Matrix(numpy.arange(6.0).reshape(2, 3), self.attrib)
+        self.xml = ET.fromstring("""<matrix columns="3" dataType="xsd:double"
+            delimiter=" " rows="2" units="test:units"
+            >0.0 1.0 2.0 3.0 4.0 5.0</matrix>""")
+        self.assertEqual(ET.tostring(self.test), ET.tostring(self.xml))
+        self.assertRaises(CMLError, Matrix, numpy.ones(3), self.attrib)
+        self.attrib.pop('units')
+        self.assertRaises(CMLError, Matrix, numpy.ones((2, 2)), self.attrib)
+
+    def testPropParam(self):
+        self.test = PropParam(self.tag, numpy.ones(3), self.attrib)
+        self.assertIsInstance(self.test.find('array'), Array)
+        self.test = PropParam(self.tag, numpy.ones((3, 3)), self.attrib)
+        self.assertIsInstance(self.test.find('matrix'), Matrix)
+
+class TestChunkedArrays(BaseArrayTest):
+
+    def write(self, element, chunksize):
+        writes = []
+        class Recorder:
+            def write(self, data):
+                writes.append(data)
+        writer = CMLStreamWriter(Recorder(), ET.Element('cml'), chunksize)
+        writer.writeElement(element).close()
+        return writes
+
+    def testChunked(self):
+        values = numpy.arange(1000) * 0.5
+        self.test = Property(values, self.attrib)
+        writes = self.write(self.test, 100)
+        # No single write holds more than one chunk of the array
+        self.assertTrue(max(len(data) for data in writes) < 1000)
+        written = ET.fromstring(''.join(writes))[0]
+        self.assertEqual(ET.tostring(written), ET.tostring(self.test))
+        self.assertEqual(written.find('array').attrib['length'], '1000')
+        self.assertEqual(len(written.find('array').text.split(' ')), 1000)
+
+    def testNonContiguous(self):
+        values = numpy.arange(1000.0).reshape(20, 50)
+        for self.test in [Matrix(values.T, self.attrib),
+                          Matrix(values[::2, 5:], self.attrib),
+                          Array(values[3, ::3], self.attrib)]:
+            self.assertFalse(self.test.values.flags.c_contiguous)
+            writes = self.write(self.test, 16)
+            self.assertTrue(max(len(data) for data in writes) < 200)
+            written = ET.fromstring(''.join(writes))[0]
+            self.assertEqual(ET.tostring(written), ET.tostring(self.test))
+            self.assertTrue(numpy.all(decodeValue(written) ==
+                                      self.test.values))
+
+    def testMatrixAndStrings(self):
+        self.test = PropertyList([{'value': numpy.ones((50, 50)),
+                                   'attrib': self.attrib},
+                                  {'value': numpy.array(['a&b'] * 30),
+                                   'attrib': self.attrib}])
+        written = ET.fromstring(''.join(self.write(self.test, 7)))[0]
+        self.assertEqual(ET.tostring(written), ET.tostring(self.test))
 
 class TestArrayUnitsReq(BaseArrayTest):
 
@@ -334,6 +430,251 @@ class TestAbstractList(TestPropParamList):
                             [{'value':self.int, 'attrib': self.attrib}])
 
 
+class TestLazyValues(TestPropParamList):
+
+    def setUp(self):
+        TestPropParamList.setUp(self)
+        self.calls = []
+
+    def expensive(self):
+        self.calls.append(True)
+        return self.floatlist
+
+    def serialise(self, element):
+        out = StringIO.StringIO()
+        writer = CMLStreamWriter(out, ET.Element('cml'))
+        writer.writeElement(element).close()
+        return ET.fromstring(out.getvalue())[0]
+
+    def testCallable(self):
+        self.test = Property(self.expensive, self.attrib)
+        self.assertEqual(self.calls, [])
+        self.assertIsNone(self.test.find('array'))
+        written = self.serialise(self.test)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(written.find('array').attrib['dataType'], 'xsd:double')
+        self.assertEqual(ET.tostring(written), ET.tostring(ET.fromstring
+                                (self.testppfloatlist.replace('testingtag',
+                                                              'property'))))
+        self.assertIsInstance(self.test.find('array'), Array)
+
+    def testGenerator(self):
+        self.test = Parameter((i for i in range(3)), self.attrib)
+        written = self.serialise(self.test)
+        self.assertEqual(written.find('array').text, '0 1 2')
+        self.assertEqual(written.find('array').attrib['dataType'], 'xsd:int')
+
+    def testRelease(self):
+        list = [{'value': self.expensive, 'attrib': self.attrib,
+                 'release': True},
+                {'value': lambda: self.int, 'attrib': self.attrib}]
+        self.test = PropertyList(list)
+        written = self.serialise(self.test)
+        self.assertIsNotNone(written[0].find('array'))
+        self.assertEqual(written[1].find('scalar').text, '5')
+        self.assertEqual(len(self.test[0]), 0)
+        self.assertEqual(len(self.test[1]), 1)
+        self.serialise(self.test)
+        self.assertEqual(len(self.calls), 2)
+
+    def testReleasedGenerator(self):
+        self.test = Property((i for i in range(3)), self.attrib, release=True)
+        self.assertEqual(self.serialise(self.test).find('array').text,
+                         '0 1 2')
+        self.assertEqual(len(self.test), 0)
+        self.assertRaises(CMLError, self.serialise, self.test)
+
+class TestSharedAttributes(TestPropParamList):
+
+    def testShared(self):
+        list = [{'value': float(i), 'attrib': {'dictRef': 'test:' + 'prop',
+                                               'units': 'test:' + 'units'}}
+                for i in range(1000)]
+        self.test = PropertyList(list)
+        attribs = set(id(element.attrib) for element in self.test.iter())
+        # The list itself, the properties and their scalars
+        self.assertEqual(len(attribs), 3)
+        self.assertIs(self.test[0].attrib['dictRef'],
+                      self.test[999].attrib['dictRef'])
+        self.assertIs(self.test[0][0].attrib, self.test[999][0].attrib)
+
+    def testDistinct(self):
+        self.test = PropertyList([{'value': self.int, 'attrib': self.attrib},
+                                  {'value': self.float, 'attrib': self.attrib},
+                                  {'value': self.intlist, 'attrib': self.attrib},
+                                  {'value': self.floatlist, 'attrib': self.attrib}])
+        self.assertIs(self.test[0].attrib, self.test[1].attrib)
+        self.assertIsNot(self.test[0][0].attrib, self.test[1][0].attrib)
+        self.assertIsNot(self.test[2][0].attrib, self.test[3][0].attrib)
+        self.assertEqual(self.test[0][0].attrib['dataType'], 'xsd:int')
+        self.assertEqual(self.test[1][0].attrib['dataType'], 'xsd:double')
+
+    def testCopyOnWrite(self):
+        first = Property(1.0, dict(self.attrib))
+        second = Property(2.0, dict(self.attrib))
+        first.set('id', 'p1')
+        first[0].set('title', 'changed')
+        self.assertEqual(first.attrib, {'dictRef': 'test:dictRef', 'id': 'p1'})
+        self.assertEqual(first[0].get('title'), 'changed')
+        for element in [second, Property(3.0, dict(self.attrib))]:
+            self.assertEqual(element.attrib, {'dictRef': 'test:dictRef'})
+            self.assertIsNone(element[0].get('title'))
+        self.assertRaises(CMLError, second.attrib.__setitem__, 'id', 'p2')
+        self.assertRaises(CMLError, second[0].attrib.update, {'id': 'p2'})
+        second.clear()
+        self.assertEqual(Property(4.0, dict(self.attrib)).attrib,
+                         {'dictRef': 'test:dictRef'})
+
+    def testReleased(self):
+        import pycml.pycml
+        attrib = {'dictRef': 'test:released', 'units': 'test:units'}
+        self.test = Property([1, 2], attrib)
+        key = (('dictRef', 'test:released'),)
+        self.assertIn(key, pycml.pycml._sharedattribs)
+        self.test = None
+        self.assertNotIn(key, pycml.pycml._sharedattribs)
+        self.assertEqual(cPickle.loads(cPickle.dumps(sharedAttrib(attrib), 2)),
+                         attrib)
+
+class TestElementCache(TestPropParamList):
+
+    def setUp(self):
+        TestPropParamList.setUp(self)
+        self.cache = ElementCache(maxsize=3)
+        self.list = [{'value': value, 'attrib': self.attrib}
+                     for value in [self.int, self.text, self.floatlist]]
+
+    def testCached(self):
+        first = ParameterList(self.list, self.cache)
+        second = ParameterList(self.list, self.cache)
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.hits, 3)
+        for old, new in zip(first, second):
+            self.assertIs(old, new)
+        self.assertEqual(ET.tostring(first), ET.tostring(second))
+
+    def testNormalisedKeys(self):
+        ParameterList([{'value': 1, 'attrib': self.attrib}], self.cache)
+        test = ParameterList([{'value': 1.0, 'attrib': self.attrib},
+                              {'value': [1, 2], 'attrib': self.attrib},
+                              {'value': [1.0, 2], 'attrib': self.attrib}],
+                             self.cache)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(test[0][0].attrib['dataType'], 'xsd:double')
+        self.assertEqual(test[2][0].text, '1.0 2.0')
+        # Property and parameter lists do not share elements
+        PropertyList([{'value': 1, 'attrib': self.attrib}], self.cache)
+        self.assertEqual(self.cache.hits, 0)
+
+    def testBounded(self):
+        for i in range(10):
+            ParameterList([{'value': i, 'attrib': self.attrib}], self.cache)
+        self.assertEqual(len(self.cache), 3)
+        ParameterList([{'value': 9, 'attrib': self.attrib}], self.cache)
+        ParameterList([{'value': 0, 'attrib': self.attrib}], self.cache)
+        self.assertEqual(self.cache.hits, 1)
+
+    def testUncacheable(self):
+        test = ParameterList([{'value': lambda: 1, 'attrib': self.attrib},
+                              {'value': numpy.ones(3), 'attrib': self.attrib}],
+                             self.cache)
+        self.assertEqual(len(self.cache), 1)
+
+    def testClassCache(self):
+        ParameterList.cache = self.cache
+        try:
+            ParameterList(self.list)
+            ParameterList(self.list)
+        finally:
+            ParameterList.cache = None
+        self.assertEqual(self.cache.hits, 3)
+
+class TestColumns(TestPropParamList):
+
+    def setUp(self):
+        TestPropParamList.setUp(self)
+        self.records = numpy.array(
+            [('test:a', 'test:units', -76.4), ('test:b', 'nonsi:hartree', 2.0),
+             ('test:a', 'test:units', 1e-20)],
+            dtype=[('dictRef', 'S16'), ('units', 'S16'), ('value', float)])
+
+    def rows(self, records):
+        return [{'value': row['value'], 'attrib': {'dictRef': row['dictRef'],
+                                                   'units': row['units']}}
+                for row in records]
+
+    def testStructuredArray(self):
+        self.test = PropertyList(self.records)
+        self.assertEqual(ET.tostring(self.test),
+                         ET.tostring(PropertyList(self.rows(self.records))))
+        self.assertIsInstance(self.test[0], Property)
+        self.assertIsInstance(self.test[0][0], Scalar)
+        self.assertIs(self.test[0].attrib, self.test[2].attrib)
+        self.assertIs(self.test[0][0].attrib, self.test[2][0].attrib)
+        self.assertEqual(decodeValue(self.test[2]), 1e-20)
+
+    def testColumnTypes(self):
+        records = numpy.zeros(2, dtype=[('dictRef', 'S8'), ('units', 'S8'),
+                                        ('value', float, (2, 3))])
+        records['dictRef'] = ['test:a', 'test:b']
+        records['units'] = 'test:units'
+        records['value'][1] = numpy.arange(6).reshape(2, 3)
+        self.test = ParameterList(records)
+        self.assertEqual(ET.tostring(self.test),
+                         ET.tostring(ParameterList(self.rows(records))))
+        self.assertIsInstance(self.test[1][0], Matrix)
+
+        columns = {'dictRef': ['test:a', 'test:b'], 'units': 'test:units',
+                   'value': [[1, 2], [3, 4]]}
+        self.test = PropertyList(columns)
+        self.assertEqual(self.test[1][0].tag, 'array')
+        self.assertEqual(self.test[1][0].attrib['length'], '2')
+        self.assertEqual(self.test[1][0].text, '3 4')
+
+        columns['value'] = [True, False]
+        self.test = PropertyList(columns)
+        self.assertEqual([p[0].text for p in self.test], ['true', 'false'])
+        self.assertEqual(self.test[0][0].attrib['dataType'], 'xsd:boolean')
+
+        columns['value'] = ['b3lyp', 'sto-3g']
+        self.test = PropertyList(columns)
+        self.assertEqual(ET.tostring(self.test),
+                         ET.tostring(PropertyList([
+                             {'value': 'b3lyp', 'attrib': self.attrib},
+                             {'value': 'sto-3g', 'attrib': self.attrib}]
+                         )).replace('test:dictRef', 'test:a', 1)
+                           .replace('test:dictRef', 'test:b', 1))
+
+    def testPythonFloats(self):
+        columns = {'dictRef': ['test:a', 'test:b', 'test:c'],
+                   'units': 'test:units', 'value': [1 / 3., 0.1, 1e16]}
+        rows = [{'value': value, 'attrib': {'dictRef': ref,
+                                            'units': 'test:units'}}
+                for ref, value in zip(columns['dictRef'], columns['value'])]
+        self.test = PropertyList(columns)
+        self.assertEqual(ET.tostring(self.test),
+                         ET.tostring(PropertyList(rows)))
+        self.assertEqual(self.test[0][0].text, repr(1 / 3.))
+        self.assertEqual(decodeValue(self.test[0]), 1 / 3.)
+
+        columns['value'] = [u'\xe9nergie', u'\u03c0', u'ok']
+        for row, value in zip(rows, columns['value']):
+            row['value'] = value
+        self.assertEqual(ET.tostring(PropertyList(columns)),
+                         ET.tostring(PropertyList(rows)))
+
+    def testColumnRequirements(self):
+        self.assertRaises(CMLError, PropertyList,
+                          self.records[['dictRef', 'value']])
+        self.assertRaises(CMLError, PropertyList,
+                          {'dictRef': ['test:a'], 'units': 'test:units',
+                           'value': [1, 2]})
+        self.assertRaises(CMLDataTypeError, PropertyList,
+                          {'dictRef': ['test:a', 'test:b'],
+                           'units': 'test:units', 'value': [1, None]})
+        self.assertRaises(CMLError, PropertyList, numpy.arange(3))
+        self.assertEqual(len(PropertyList(self.records[:0])), 0)
+
 class TestPropertyList(TestPropParamList):
 
     def testGeneratePropertyListSingleItem(self):
@@ -465,6 +806,374 @@ class TestPy2xsd(TestElement):
         self.assertRaises(CMLError, py2xsdtype, {})
         self.assertRaises(CMLError, py2xsdtype, None)
 
+    def testNumpyTypes(self):
+        self.assertEqual(py2xsdtype(True), 'xsd:boolean')
+        self.assertEqual(py2xsdtype(numpy.int64(1)), 'xsd:int')
+        self.assertEqual(py2xsdtype(numpy.int32(1)), 'xsd:int')
+        self.assertEqual(py2xsdtype(numpy.float32(1)), 'xsd:double')
+        self.assertEqual(py2xsdtype(numpy.float64(1)), 'xsd:double')
+        self.assertEqual(py2xsdtype(numpy.bool_(1)), 'xsd:boolean')
+        self.assertRaises(CMLDataTypeError, py2xsdtype, 1j)
+
+    def testDtypes(self):
+        self.assertEqual(dtype2xsdtype(numpy.arange(3).dtype), 'xsd:int')
+        self.assertEqual(dtype2xsdtype(numpy.dtype('uint8')), 'xsd:int')
+        self.assertEqual(dtype2xsdtype(numpy.dtype('float32')), 'xsd:double')
+        self.assertEqual(dtype2xsdtype(numpy.array(['a']).dtype), 'xsd:str')
+        self.assertRaises(CMLDataTypeError, dtype2xsdtype,
+                          numpy.array([None]).dtype)
+
+    def testRegister(self):
+        self.assertRaises(CMLDataTypeError, dtype2xsdtype,
+                          numpy.dtype('timedelta64[s]'))
+        registerXSDType(numpy.timedelta64, 'xsd:duration', 'm')
+        self.assertEqual(py2xsdtype(numpy.timedelta64(1, 's')),
+                         'xsd:duration')
+        self.assertEqual(dtype2xsdtype(numpy.dtype('timedelta64[s]')),
+                         'xsd:duration')
+
+    def testBooleanScalar(self):
+        self.test = PropParam(self.tag, True, self.attrib)
+        self.assertEqual(self.test.find('scalar').text, 'true')
+
+class TestMolecule(TestElement):
+
+    def setUp(self):
+        TestElement.setUp(self)
+        self.elements = ['O', 'H', 'H']
+        self.coords = numpy.array([[0.0, 0.0, 0.0],
+                                   [0.96, 0.0, 0.0],
+                                   [-0.24, 0.93, 0.0]])
+        self.stringin = """<molecule id="water"><atomArray atomID="a1 a2 a3"
+        elementType="O H H" formalCharge="0 0 0" x3="0.0 0.96 -0.24"
+        y3="0.0 0.0 0.93" z3="0.0 0.0 0.0" /><bondArray atomRef1="a1 a1"
+        atomRef2="a2 a3" order="1 1" /></molecule>"""
+
+    def testGenerate(self):
+        self.test = Molecule(self.elements, self.coords, [0, 0, 0],
+                             [[0, 1], [0, 2]], [1, 1], {'id': 'water'})
+        self.assertEqual(ET.tostring(self.test),
+                         ET.tostring(ET.fromstring(self.stringin)))
+
+    def testAtomsOnly(self):
+        self.test = Molecule(self.elements, self.coords)
+        self.assertIsNone(self.test.find('bondArray'))
+        self.assertNotIn('formalCharge', self.test.find('atomArray').attrib)
+
+    def testLargeMolecule(self):
+        natoms = 100000
+        coords = numpy.arange(natoms * 3, dtype=float).reshape(natoms, 3)
+        self.test = Molecule(numpy.repeat('C', natoms), coords)
+        x3 = self.test.find('atomArray').attrib['x3'].split(' ')
+        self.assertEqual(len(x3), natoms)
+        self.assertEqual(x3[-1], str(coords[-1, 0]))
+
+    def testRequirements(self):
+        self.assertRaises(CMLError, Molecule, self.elements, self.coords[:2])
+        self.assertRaises(CMLError, Molecule, self.elements, self.coords,
+                          [0.5, 0, 0])
+        self.assertRaises(CMLError, Molecule, self.elements, self.coords,
+                          None, [[0, 3]])
+        self.assertRaises(CMLError, Molecule, self.elements, self.coords,
+                          None, [[0, 1]], [1, 1])
+
+class TestFormatArray(TestElement):
+
+    def testFormat(self):
+        self.assertEqual(formatArray([1, 2, 3]), '1 2 3')
+        self.assertEqual(formatArray([1.5, 1.5e6]), '1.5 1500000.0')
+        self.assertEqual(formatArray([1.23456, 2.0], precision=3),
+                         '1.235 2.000')
+        self.assertEqual(formatArray(['a', 'b'], delimiter=','), 'a,b')
+
+class TestDecodeValue(TestPropParamList):
+
+    def testScalars(self):
+        for value in [self.int, self.text, self.float, True]:
+            self.test = Property(value, self.attrib)
+            parsed = ET.fromstring(ET.tostring(self.test))
+            for element in [self.test, parsed]:
+                self.assertEqual(decodeValue(element), value)
+                self.assertEqual(type(decodeValue(element)), type(value))
+
+    def testArrays(self):
+        for value in [self.intlist, self.floatlist, self.strlist,
+                      numpy.arange(6.0).reshape(2, 3), [True, False]]:
+            self.test = Property(value, self.attrib)
+            parsed = ET.fromstring(ET.tostring(self.test))
+            for element in [self.test, parsed]:
+                decoded = decodeValue(element)
+                self.assertIsInstance(decoded, numpy.ndarray)
+                self.assertTrue(numpy.all(decoded == numpy.asarray(value)))
+
+    def testUnicode(self):
+        for value, expected in [(u'M\xf8ller-Plesset', u'M\xf8ller-Plesset'),
+                                ([u'M\xf8ller', u'b', 1],
+                                 [u'M\xf8ller', u'b', u'1'])]:
+            self.test = Property(value, self.attrib)
+            out = StringIO.StringIO()
+            writer = CMLStreamWriter(out, ET.Element('cml'), chunksize=2)
+            writer.writeElement(self.test).close()
+            self.assertEqual(out.getvalue().split('\n', 1)[1],
+                             ET.tostring(ET.Element('cml')).replace(' />', '>')
+                             + ET.tostring(self.test, encoding='utf-8')
+                             + '</cml>')
+            parsed = ET.fromstring(out.getvalue())[0]
+            for element in [self.test, parsed]:
+                self.assertEqual(numpy.asarray(decodeValue(element)).tolist(),
+                                 expected)
+
+    def testNamespaced(self):
+        for value in [self.float, numpy.arange(6.0).reshape(2, 3)]:
+            self.test = Property(value, self.attrib)
+            parsed = ET.fromstring('<cml xmlns="http://www.xml-cml.org/schema">'
+                                   '%s</cml>' % ET.tostring(self.test))[0]
+            self.assertEqual(parsed.tag,
+                             '{http://www.xml-cml.org/schema}property')
+            self.assertTrue(numpy.all(decodeValue(parsed) == value))
+            self.assertTrue(numpy.all(decodeValue(parsed[0]) == value))
+
+    def testNoValue(self):
+        self.assertRaises(CMLError, decodeValue, CMLModule(self.attrib))
+        self.assertRaises(CMLError, decodeValue,
+                          Property(lambda: 1, self.attrib))
+
+class TestIterparse(TestPropParamList):
+
+    def testPruned(self):
+        doc = CMLDoc()
+        doc.appendElement(PropertyList([{'value': value, 'attrib': self.attrib}
+                                        for value in range(100)]))
+        out = StringIO.StringIO()
+        doc.serialise(out)
+        out.seek(0)
+        values = []
+        previous = None
+        for event, element in iterparse(out, ('property',)):
+            if event == 'start' and element.tag == 'propertyList':
+                plist = element
+            elif event == 'end' and element.tag == 'property':
+                values.append(decodeValue(element))
+                # Earlier properties have been dropped from the tree
+                self.assertNotIn(previous, list(plist))
+                previous = element
+        self.assertEqual(values, range(100))
+        self.assertEqual(len(plist), 0)
+
+class TestDictRefIndex(TestPropParamList):
+
+    def setUp(self):
+        TestPropParamList.setUp(self)
+        self.doc = CMLDoc()
+        self.module = CMLModule({'dictRef': 'test:outer'})
+        inner = CMLModule({'dictRef': 'test:inner'})
+        inner.append(PropertyList([{'value': self.float,
+                                    'attrib': self.attrib}]))
+        self.module.append(inner)
+        self.module.append(PropertyList([{'value': self.intlist,
+                                          'attrib': self.attrib}]))
+        self.doc.appendElement(self.module)
+
+    def testFind(self):
+        self.assertEqual(len(self.doc.find('test:dictRef')), 2)
+        self.assertEqual(self.doc.find('test:outer'), [self.module])
+        self.assertEqual(self.doc.find('test:inner', 'outer'),
+                         [self.module[0]])
+        self.assertEqual(self.doc.find('test:dictRef', 'outer/inner'),
+                         [self.module[0][0][0]])
+        self.assertEqual(self.doc.find('test:missing'), [])
+
+    def testGetValue(self):
+        self.assertEqual(self.doc.getValue('test:dictRef', 'outer/inner'),
+                         self.float)
+        self.assertEqual(list(self.doc.getValue('test:dictRef', 'outer')),
+                         self.intlist)
+        self.assertRaises(CMLError, self.doc.getValue, 'test:missing')
+
+    def testElements(self):
+        self.assertEqual(self.doc.getElements(), [self.module])
+        self.assertRaises(CMLError, self.doc.appendElement, 'test')
+
+###
+#Testing of streaming output
+####
+
+class TestStreamWriter(TestPropParamList):
+
+    def setUp(self):
+        TestPropParamList.setUp(self)
+        self.root = ET.Element('{http://www.xml-cml.org/schema}cml')
+        self.module = CMLModule({'dictRef': 'test:module'})
+        self.module.append(PropertyList([{'value': self.floatlist,
+                                          'attrib': self.attrib}]))
+
+    def testMatchesElementTree(self):
+        self.root.append(self.module)
+        expected = StringIO.StringIO()
+        ET.ElementTree(self.root).write(expected, encoding='UTF-8',
+                                        xml_declaration=True)
+        out = StringIO.StringIO()
+        writer = CMLStreamWriter(out, self.root)
+        writer.startElement(self.module)
+        for element in self.module:
+            writer.writeElement(element)
+        writer.close()
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
+    def testWriteElements(self):
+        self.module.append(PropertyList([{'value': i, 'attrib': self.attrib}
+                                         for i in range(50)]))
+        self.module.append(CMLModule({'dictRef': 'test:empty'}))
+        self.module.append(PropertyList([{'value': lambda: [1, 2],
+                                          'attrib': self.attrib}]))
+        self.module.append(Molecule(['H', 'H'], numpy.zeros((2, 3))))
+        expected = StringIO.StringIO()
+        CMLStreamWriter(expected, self.root).writeElement(self.module).close()
+        for processes in [1, 3]:
+            out = StringIO.StringIO()
+            writer = CMLStreamWriter(out, self.root)
+            writer.writeElements([self.module], processes, batchsize=8)
+            writer.close()
+            self.assertEqual(out.getvalue(), expected.getvalue())
+
+        pieces = []
+        writer._plan([self.module], 8, pieces)
+        batches = [piece for piece in pieces if type(piece) == list]
+        self.assertEqual(pieces[0], '<module dictRef="test:module">')
+        self.assertEqual(sum(len(batch) for batch in batches), 53)
+        self.assertTrue(isinstance(pieces[-3], PropertyList))
+
+    def testWriteElementsConcurrently(self):
+        import threading
+        modules = []
+        for n in range(4):
+            module = CMLModule({'dictRef': 'test:module%d' % n})
+            module.append(PropertyList([{'value': i * n,
+                                         'attrib': self.attrib}
+                                        for i in range(40)]))
+            modules.append(module)
+        outputs = [StringIO.StringIO() for module in modules]
+        def write(module, out):
+            writer = CMLStreamWriter(out, self.root)
+            writer.writeElements([module], 2, batchsize=4).close()
+        threads = [threading.Thread(target=write, args=args)
+                   for args in zip(modules, outputs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for module, out in zip(modules, outputs):
+            expected = StringIO.StringIO()
+            CMLStreamWriter(expected, self.root).writeElement(module).close()
+            self.assertEqual(out.getvalue(), expected.getvalue())
+
+    def testSuppliedPool(self):
+        import multiprocessing
+        doc = CMLDoc()
+        module = CMLModule({'dictRef': 'test:module'})
+        module.append(PropertyList([{'value': value, 'attrib': self.attrib}
+                                    for value in [1.5, 'b&c', [1, 2],
+                                                  numpy.eye(2)] * 10]))
+        doc.appendElement(module)
+        expected = doc.serialise(StringIO.StringIO()).getvalue()
+        pool = multiprocessing.Pool(2)
+        try:
+            for i in range(2):
+                out = doc.serialise(StringIO.StringIO(), pool=pool)
+                self.assertEqual(out.getvalue(), expected)
+            self.assertEqual(pool.map(abs, [-1]), [1])
+        finally:
+            pool.close()
+            pool.join()
+
+    def testChunkedNotBatched(self):
+        plist = PropertyList([{'value': numpy.arange(100.0),
+                               'attrib': self.attrib},
+                              {'value': 1.0, 'attrib': self.attrib}])
+        writer = CMLStreamWriter(StringIO.StringIO(), self.root, chunksize=10)
+        self.assertFalse(writer._isPortable(plist[0]))
+        self.assertTrue(writer._isPortable(plist[1]))
+        pieces = []
+        writer._plan([plist], 1, pieces)
+        self.assertEqual(pieces, ['<propertyList>', plist[0], [plist[1]],
+                                  '</propertyList>'])
+
+    def testTrajectory(self):
+        out = StringIO.StringIO()
+        def frames():
+            for i in range(5):
+                # Every earlier frame has been written before the next one
+                # is requested
+                self.assertEqual(out.getvalue().count('<molecule'), i)
+                yield numpy.ones((2, 3)) * i
+        writer = CMLStreamWriter(out, self.root)
+        trajectory = TrajectoryWriter(writer, ['H', 'H'],
+                                      {'dictRef': 'test:trajectory'}, 3)
+        trajectory.writeFrames(frames()).close()
+        writer.close()
+
+        molecules = ET.fromstring(out.getvalue()).find('module')
+        self.assertEqual(len(molecules), 5)
+        self.assertEqual(trajectory.nframes, 5)
+        self.assertEqual(molecules[4].attrib['id'], 'frame5')
+        self.assertEqual(molecules[4].find('atomArray').attrib['x3'],
+                         '4.000 4.000')
+
+class TestExternalPayloads(TestPropParamList):
+
+    def setUp(self):
+        TestPropParamList.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.base = os.path.join(self.directory, 'doc')
+        self.doc = CMLDoc()
+        self.module = CMLModule({'dictRef': 'test:module'})
+        self.module.append(PropertyList([
+            {'value': numpy.arange(2000.0), 'attrib': self.attrib},
+            {'value': numpy.arange(3000).reshape(1000, 3),
+             'attrib': self.attrib},
+            {'value': numpy.arange(5.0), 'attrib': self.attrib}]))
+        self.doc.appendElement(self.module)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def serialise(self, payloads):
+        out = StringIO.StringIO()
+        self.doc.serialise(out, payloads)
+        return ET.fromstring(out.getvalue())
+
+    def checkValues(self, root):
+        properties = root.find('module/propertyList')
+        array, matrix, small = [decodeValue(p, self.directory)
+                                for p in properties]
+        self.assertTrue(numpy.array_equal(array, numpy.arange(2000.0)))
+        self.assertTrue(numpy.array_equal(matrix,
+                                          numpy.arange(3000).reshape(1000, 3)))
+        self.assertEqual(small.tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertTrue(isinstance(array, numpy.memmap))
+        self.assertEqual(properties[2][0].get('payload'), None)
+        return properties
+
+    def testNpy(self):
+        properties = self.checkValues(self.serialise(ExternalPayloads(self.base)))
+        self.assertEqual(properties[0][0].attrib['payload'], 'doc.0.npy')
+        self.assertEqual(properties[1][0].attrib['payloadShape'], '1000 3')
+        self.assertEqual(properties[1][0].attrib['rows'], '1000')
+        self.assertEqual(properties[0][0].text, None)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['doc.0.npy', 'doc.1.npy'])
+
+    def testShared(self):
+        root = self.serialise(ExternalPayloads(self.base, shared=True))
+        properties = self.checkValues(root)
+        self.assertEqual(properties[0][0].attrib['payload'], 'doc.bin')
+        self.assertEqual(properties[1][0].attrib['payloadOffset'], '16000')
+        self.assertEqual(os.listdir(self.directory), ['doc.bin'])
+
+    def testMissingAttribute(self):
+        element = ET.Element('array', {'payload': 'doc.bin'})
+        self.assertRaises(CMLError, loadPayload, element)
+
 ###
 #Testing of CML Document object
 ####
@@ -1,4 +1,7 @@
+import os
+import tempfile
 import unittest
+import numpy
 from test_pycml import TestParameterList
 from pycml.conventions.simple_comp_chem import *
 
@@ -18,6 +21,101 @@ class TestCompChemModule(TestParameterList):
         self.assertRaises(TypeError, CompChemModule)
         self.assertRaises(UserWarning, CompChemModule, 'test-dictRef')
 
+    def testColumns(self):
+        columns = numpy.array([('compchem:charge', 'si:none', 0),
+                               ('compchem:multiplicity', 'si:none', 1)],
+                              dtype=[('dictRef', 'S32'), ('units', 'S8'),
+                                     ('value', int)])
+        self.test = Initialisation(columns, 'test-title')
+        self.assertEqual(len(self.test), 1)
+        self.assertEqual([p.attrib['dictRef'] for p in self.test[0]],
+                         ['compchem:charge', 'compchem:multiplicity'])
+
+class TestSimpleCompChemIndex(TestParameterList):
+
+    def testIndex(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem(env=True)
+        doc.initialisation().populate([{'value': self.int,
+                                        'attrib': self.attrib}])
+        doc.finalisation().populate([{'value': self.float,
+                                      'attrib': self.attrib}])
+        self.assertEqual(doc.getValue('test:dictRef',
+                                      'jobsList/job/initialisation'), self.int)
+        self.assertEqual(doc.getValue('test:dictRef',
+                                      'jobsList/job/finalisation'), self.float)
+        self.assertEqual(len(doc.find('test:dictRef')), 2)
+        self.assertEqual(doc.find('environment', 'jobsList/job'),
+                         [doc.environment()])
+
+class TestAppendJob(TestParameterList):
+
+    def setUp(self):
+        TestParameterList.setUp(self)
+        self.list = [{'value': value, 'attrib': self.attrib}
+                     for value in [self.int, self.text, self.floatlist]]
+        handle, self.filename = tempfile.mkstemp(suffix='.cml')
+        os.close(handle)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem()
+        doc.initialisation().populate(self.list)
+        doc.write(open(self.filename, 'wb')).close()
+
+    def tearDown(self):
+        TestParameterList.tearDown(self)
+        os.remove(self.filename)
+
+    def testAppendJob(self):
+        job = Job('second job')
+        job.append(Finalisation(self.list, 'second finalisation'))
+        appendJob(self.filename, job, blocksize=16)
+        root = ET.parse(self.filename).getroot()
+        jobs = root.find('module').findall('module')
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[1].find('module').attrib['dictRef'],
+                         'finalisation')
+        self.assertTrue(open(self.filename).read().endswith('</cml:cml>'))
+
+    def testAppendTo(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem()
+        doc.finalisation().populate(self.list)
+        doc.appendTo(self.filename)
+        doc.appendTo(self.filename)
+        root = ET.parse(self.filename).getroot()
+        jobs = root.find('module').findall('module')
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(len(jobs[2]), 2)
+
+    def testStream(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem()
+        doc.finalisation().populate(self.list)
+        frames = (numpy.zeros((3, 3)) + i for i in range(10))
+        doc.stream(open(self.filename, 'wb'), ['O', 'H', 'H'], frames).close()
+        finalisation = ET.parse(self.filename).getroot()[0][0][1]
+        self.assertIsNotNone(finalisation.find('propertyList'))
+        trajectory = finalisation.find('module')
+        self.assertEqual(trajectory.attrib['dictRef'], 'trajectory')
+        self.assertEqual(len(trajectory.findall('molecule')), 10)
+
+    def testNotAJobsList(self):
+        open(self.filename, 'wb').write('<cml><scalar>1</scalar></cml>')
+        self.assertRaises(CMLError, appendJob, self.filename, Job('job'))
+        for content in ['<cml><module dictRef="compchem:jobsList"><module '
+                        'dictRef="compchem:job"/></module><module dictRef='
+                        '"compchem:finalisation"><module dictRef="x:y">'
+                        '</module></module></cml>',
+                        '<cml><module><module dictRef="compchem:jobsList">'
+                        '</module></module></cml>']:
+            open(self.filename, 'wb').write(content)
+            self.assertRaises(CMLError, appendJob, self.filename, Job('job'))
+            self.assertEqual(open(self.filename).read(), content)
+
 if __name__ == '__main__':
     warnings.simplefilter('error')
     unittest.main()
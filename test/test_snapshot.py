@@ -0,0 +1,93 @@
+import os
+import StringIO
+import tempfile
+import unittest
+import warnings
+import numpy
+from pycml.snapshot import *
+from pycml.pycml import *
+from pycml.conventions.simple_comp_chem import SimpleCompChem
+
+###
+#Testing of binary snapshots
+####
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.attrib = {'dictRef': 'test:dictRef', 'units': 'test:units'}
+        self.doc = CMLDoc()
+        module = CMLModule({'dictRef': 'test:module', 'title': 'test'})
+        module.append(PropertyList([
+            {'value': numpy.linspace(0, 1, 7), 'attrib': self.attrib},
+            {'value': numpy.arange(12).reshape(3, 4), 'attrib': self.attrib},
+            {'value': ['a', 'b&c'], 'attrib': self.attrib},
+            {'value': numpy.array([], dtype=float), 'attrib': self.attrib},
+            {'value': 1.5, 'attrib': self.attrib},
+            {'value': lambda: numpy.ones(3), 'attrib': self.attrib},
+            {'value': 'text', 'attrib': self.attrib}]))
+        module.append(Molecule(['O', 'H', 'H'], numpy.eye(3)))
+        self.doc.appendElement(module)
+        handle, self.filename = tempfile.mkstemp(suffix='.snapshot')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def serialise(self, doc):
+        return doc.serialise(StringIO.StringIO()).getvalue()
+
+    def testRoundTrip(self):
+        expected = self.serialise(self.doc)
+        saveSnapshot(self.doc, open(self.filename, 'wb')).close()
+        loaded = loadSnapshot(self.filename)
+        self.assertEqual(self.serialise(loaded), expected)
+        values = loaded.find('test:dictRef')[1][0].values
+        self.assertEqual(values.shape, (3, 4))
+        self.assertFalse(values.flags.writeable)
+
+    def testSharedAttributes(self):
+        saveSnapshot(self.doc, open(self.filename, 'wb')).close()
+        loaded = loadSnapshot(self.filename)
+        properties = loaded.find('test:dictRef')
+        self.assertIs(properties[0].attrib, properties[4].attrib)
+        self.assertIs(properties[0][0].attrib['units'],
+                      properties[1][0].attrib['units'])
+        properties[0].set('id', 'p1')
+        properties[1][0].set('title', 'grid')
+        self.assertNotIn('id', properties[4].attrib)
+        self.assertNotIn('title', properties[2][0].attrib)
+        self.assertRaises(CMLError, properties[4].attrib.__setitem__, 'id', 'p')
+
+    def testFileObject(self):
+        out = saveSnapshot(self.doc, StringIO.StringIO())
+        out.seek(0)
+        self.assertEqual(self.serialise(loadSnapshot(out)),
+                         self.serialise(self.doc))
+
+    def testIndex(self):
+        saveSnapshot(self.doc, open(self.filename, 'wb')).close()
+        loaded = loadSnapshot(self.filename)
+        self.assertEqual(len(loaded.find('test:dictRef', 'module')), 7)
+        self.assertTrue(numpy.array_equal(loaded.getValue('test:dictRef'),
+                                          numpy.linspace(0, 1, 7)))
+
+    def testNotASnapshot(self):
+        self.assertRaises(CMLError, loadSnapshot,
+                          StringIO.StringIO('<cml></cml>'))
+
+    def testSimpleCompChem(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            doc = SimpleCompChem()
+        doc.finalisation().populate([{'value': numpy.arange(5.0),
+                                      'attrib': self.attrib}])
+        saveSnapshot(doc, open(self.filename, 'wb')).close()
+        loaded = loadSnapshot(self.filename)
+        self.assertEqual(self.serialise(loaded),
+                         doc.write(StringIO.StringIO()).getvalue())
+        self.assertEqual(len(loaded.find('test:dictRef',
+                                         'jobsList/job/finalisation')), 1)
+
+if __name__ == '__main__':
+    unittest.main()
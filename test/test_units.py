@@ -0,0 +1,98 @@
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+import numpy
+from pycml.dictionary import *
+from pycml.units import *
+from pycml.pycml import *
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+###
+#Testing of unit conversion
+####
+
+class TestUnitConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.converter = UnitConverter()
+
+    def testConvert(self):
+        self.assertAlmostEqual(convert(1.0, 'nonsi:hartree',
+                                       'nonsi:electronvolt'), 27.211386, 6)
+        self.assertAlmostEqual(convert(25.0, 'nonsi:celsius', 'si:k'), 298.15)
+        self.assertAlmostEqual(convert(298.15, 'si:k', 'nonsi:celsius'), 25.0)
+        self.assertEqual(convert('b3lyp', 'si:none', 'si:none'), 'b3lyp')
+        self.assertRaises(CMLError, convert, 1.0, 'nonsi:hartree', 'si:m')
+        self.assertRaises(CMLError, convert, 1.0, 'nonsi:parsec', 'si:m')
+        self.assertRaises(CMLDataTypeError, convert, ['a'], 'nonsi:bohr',
+                          'nonsi:angstrom')
+
+    def testArrays(self):
+        coords = numpy.arange(6).reshape(2, 3)
+        converted = self.converter.convert(coords, 'nonsi:bohr',
+                                           'nonsi:angstrom')
+        self.assertEqual(converted.shape, (2, 3))
+        self.assertTrue(numpy.allclose(converted, coords * 0.529177210903))
+        self.assertTrue(numpy.allclose(
+            self.converter.convert([0, 100], 'nonsi:celsius', 'si:k'),
+            [273.15, 373.15]))
+
+    def testCache(self):
+        factor = self.converter.factor('nonsi:bohr', 'nonsi:angstrom')
+        self.assertTrue(self.converter.factor('nonsi:bohr', 'nonsi:angstrom')
+                        is factor)
+        self.assertEqual(sorted(self.converter._units),
+                         ['nonsi:angstrom', 'nonsi:bohr'])
+
+    def testDictionaries(self):
+        cachedir = tempfile.mkdtemp()
+        try:
+            dictionaries = CMLDictionaries(
+                [os.path.join(DATA, 'nonsi_units.xml')], cachedir)
+            dictionaries.units['nonsi:hartree'] = dict(
+                dictionaries.units['nonsi:hartree'], multiplierToSI='2')
+            converter = UnitConverter(dictionaries)
+            self.assertEqual(converter.unit('nonsi:hartree'),
+                             (2.0, 0.0, 'unitType:energy'))
+            self.assertEqual(converter.unit('si:joule'),
+                             (1.0, 0.0, 'unitType:energy'))
+            self.assertEqual(converter.convert(3, 'nonsi:hartree', 'si:joule'),
+                             6.0)
+        finally:
+            shutil.rmtree(cachedir)
+
+    def testValues(self):
+        doc = CMLDoc()
+        module = CMLModule({'dictRef': 'test:module'})
+        module.append(PropertyList([
+            {'value': -76.4, 'attrib': {'dictRef': 'test:energy',
+                                        'units': 'nonsi:hartree'}},
+            {'value': numpy.eye(3), 'attrib': {'dictRef': 'test:coords',
+                                               'units': 'nonsi:bohr'}},
+            {'value': 'b3lyp', 'attrib': {'dictRef': 'test:method',
+                                          'units': 'si:none'}}]))
+        doc.appendElement(module)
+        out = StringIO.StringIO()
+        doc.serialise(out)
+        # The same document with the CML namespace as the default namespace
+        namespaced = StringIO.StringIO(out.getvalue()
+            .replace('<cml:cml xmlns:cml=', '<cml xmlns=')
+            .replace('</cml:cml>', '</cml>'))
+        self.assertIn('<cml xmlns=', namespaced.getvalue())
+
+        for source in [out, namespaced]:
+            source.seek(0)
+            values = list(self.converter.values(source,
+                          {'test:energy': 'nonsi:electronvolt',
+                           'test:coords': 'nonsi:angstrom'}))
+            self.assertEqual([dictref for dictref, value in values],
+                             ['test:energy', 'test:coords'])
+            self.assertAlmostEqual(values[0][1], -76.4 * 27.211386245988)
+            self.assertTrue(numpy.allclose(values[1][1],
+                                           numpy.eye(3) * 0.529177210903))
+
+if __name__ == '__main__':
+    unittest.main()